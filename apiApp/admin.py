@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
-from .models import Cart, CartItem, Category, CustomUser, Order, OrderItem, Product, ProductRating, Reviews, Wishlist
+from .models import Cart, CartItem, Category, CustomUser, MediaTask, Order, OrderItem, Product, ProductRating, Reviews, WebhookEvent, Wishlist
 
 # Register your models here.
 
@@ -17,5 +17,39 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'slug']
 admin.site.register(Category, CategoryAdmin)
 
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'event_type', 'status', 'attempts', 'next_attempt_at']
+    list_filter = ['status', 'event_type']
+admin.site.register(WebhookEvent, WebhookEventAdmin)
 
-admin.site.register([Cart, CartItem, Reviews, ProductRating, Wishlist, Order, OrderItem])
\ No newline at end of file
+class MediaTaskAdmin(admin.ModelAdmin):
+    list_display = ['model', 'object_id', 'source', 'status', 'attempts', 'updated_at']
+    list_filter = ['status', 'model']
+admin.site.register(MediaTask, MediaTaskAdmin)
+
+# The __str__ of these models follows foreign keys, so the changelists
+# select them up front instead of issuing a query per row.
+
+class CartItemAdmin(admin.ModelAdmin):
+    list_select_related = ['product', 'cart']
+admin.site.register(CartItem, CartItemAdmin)
+
+class ReviewsAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'rating', 'created_at']
+    list_select_related = ['product', 'user']
+admin.site.register(Reviews, ReviewsAdmin)
+
+class ProductRatingAdmin(admin.ModelAdmin):
+    list_select_related = ['product']
+admin.site.register(ProductRating, ProductRatingAdmin)
+
+class WishlistAdmin(admin.ModelAdmin):
+    list_select_related = ['product', 'user']
+admin.site.register(Wishlist, WishlistAdmin)
+
+class OrderItemAdmin(admin.ModelAdmin):
+    list_select_related = ['product', 'order']
+admin.site.register(OrderItem, OrderItemAdmin)
+
+
+admin.site.register([Cart, Order])
\ No newline at end of file
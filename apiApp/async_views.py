@@ -0,0 +1,111 @@
+import json
+
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Cart, Category, Product
+from .pagination import ProductCursorPagination, SearchPagination
+from .search import SearchResults
+from .serializers import CategoryListSerializer, ProductDetailSerializer, ProductListSerializer
+from .views import checkout_session_params
+from . import cache as catalog_cache
+from .conditional import catalog_condition
+from .fastpath import product_rows
+
+
+# Async twins of the read endpoints (and checkout) for ASGI deployments.
+# They return the same JSON as the DRF views in views.py, but a request
+# waiting on the database or on Stripe no longer holds a worker thread.
+
+
+def json_response(data, status=200):
+    # Same encoder and compact separators as DRF's JSONRenderer.
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder,
+                        json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+
+
+@catalog_condition
+@require_GET
+async def product_list(request):
+    products = Product.objects.filter(featured=True)
+    paginator = ProductCursorPagination()
+    if settings.FAST_SERIALIZATION:
+        page = await sync_to_async(paginator.paginate_queryset)(product_rows.values(products), Request(request))
+        return json_response(paginator.get_paginated_response(product_rows.many(page)).data)
+    products = products.only(*ProductListSerializer.Meta.fields)
+    # DRF pagination is synchronous, so it runs on the ORM thread.
+    page = await sync_to_async(paginator.paginate_queryset)(products, Request(request))
+    serializer = ProductListSerializer(page, many=True)
+    return json_response(paginator.get_paginated_response(serializer.data).data)
+
+
+@catalog_condition
+@require_GET
+async def product_detail(request, slug):
+    async def build():
+        product = await Product.objects.aget(slug=slug)
+        return ProductDetailSerializer(product).data
+
+    try:
+        data = await catalog_cache.aget_or_build('product', slug, build, request.catalog_version)
+    except Product.DoesNotExist:
+        return json_response({"error": "Product not found"}, status=404)
+    return json_response(data)
+
+
+@catalog_condition
+@require_GET
+async def category_list(request):
+    async def build():
+        categories = [category async for category in Category.objects.all()]
+        return CategoryListSerializer(categories, many=True).data
+
+    return json_response(await catalog_cache.aget_or_build('category', 'list', build, request.catalog_version))
+
+
+@require_GET
+async def product_search(request):
+    query = request.GET.get('query')
+
+    if not query:
+        return json_response({"error": "Please provide a search query"}, status=400)
+    paginator = SearchPagination()
+    if settings.FAST_SERIALIZATION:
+        results = SearchResults(query, rows=product_rows)
+        page = await sync_to_async(paginator.paginate_queryset)(results, Request(request))
+        return json_response(paginator.get_paginated_response(product_rows.many(page)).data)
+    page = await sync_to_async(paginator.paginate_queryset)(SearchResults(query), Request(request))
+    serializer = ProductListSerializer(page, many=True)
+    return json_response(paginator.get_paginated_response(serializer.data).data)
+
+
+@csrf_exempt
+@require_POST
+async def create_checkout_session(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return json_response({"error": "Invalid JSON body"}, status=400)
+    cart_code = data.get("cart_code")
+    email = data.get("email")
+
+    try:
+        cart = await Cart.objects.aget(cart_code=cart_code)
+    except Cart.DoesNotExist:
+        return json_response({"error": "Cart not found"}, status=404)
+    cartitems = [item async for item in cart.cartitems.select_related('product')]
+
+    # The Stripe client is blocking; run it off the event loop, outside the
+    # ORM thread, so other requests keep being served while it waits.
+    create_session = sync_to_async(stripe.checkout.Session.create, thread_sensitive=False)
+    try:
+        checkout_session = await create_session(**checkout_session_params(cart_code, email, cartitems))
+        return json_response({'data': checkout_session})
+    except Exception as e:
+        return json_response({'error': str(e)}, status=400)
@@ -0,0 +1,376 @@
+import hashlib
+import hmac
+import json
+import random
+import time
+import tracemalloc
+import uuid
+from collections import namedtuple
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import Client
+from django.conf import settings
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from . import cache as catalog_cache
+from . import conditional
+from . import ratings, search, views
+from .fastpath import product_rows
+from .models import Cart, CartItem, Category, CustomUser, Order, OrderItem, Product, Reviews
+from .serializers import ProductListSerializer
+
+
+# Endpoint benchmark: seeds a synthetic catalog, drives every route in
+# apiApp/urls.py through the test client and records query count, latency
+# and peak memory. Query counts are checked against query_budgets.json so
+# an N+1 regression fails CI (see QueryBudgetTests) before it ships.
+
+BUDGETS_PATH = Path(__file__).resolve().parent / 'query_budgets.json'
+WEBHOOK_SECRET = 'whsec_benchmark'
+EXPORT_TOKEN = 'export_benchmark'
+
+WORDS = [
+    "wireless", "smart", "leather", "running", "classic", "portable", "digital", "cotton", "ultra", "compact",
+    "camera", "watch", "shoe", "shirt", "speaker", "headphones", "backpack", "jacket", "lamp", "keyboard",
+]
+
+def seed_catalog(products, categories, users, carts, reviews, orders, batch_size=2_000, seed=42):
+    rng = random.Random(seed)
+    # Slugs and ids are tagged per run so seeding twice never collides.
+    run = uuid.uuid4().hex[:8]
+
+    def name():
+        return " ".join(rng.choice(WORDS) for _ in range(3)).title()
+
+    with transaction.atomic():
+        category_ids = [c.id for c in Category.objects.bulk_create(
+            [Category(name=f"Category {i}", slug=f"bench-{run}-c{i}") for i in range(categories)],
+            batch_size=batch_size,
+        )]
+        product_ids = [p.id for p in Product.objects.bulk_create(
+            [
+                Product(
+                    name=name(),
+                    description=" ".join(rng.choice(WORDS) for _ in range(12)),
+                    price=Decimal(rng.randint(100, 100_000)) / 100,
+                    slug=f"bench-{run}-p{i}",
+                    featured=rng.random() < 0.8,
+                    category_id=rng.choice(category_ids) if category_ids else None,
+                )
+                for i in range(products)
+            ],
+            batch_size=batch_size,
+        )]
+        user_objs = CustomUser.objects.bulk_create(
+            [
+                CustomUser(username=f"bench-{run}-u{i}", email=f"bench-{run}-u{i}@example.com", password="!")
+                for i in range(users)
+            ],
+            batch_size=batch_size,
+        )
+        user_ids = [u.id for u in user_objs]
+
+        cart_objs = Cart.objects.bulk_create(
+            [Cart(cart_code=f"{run[:4]}{i:08x}") for i in range(carts)], batch_size=batch_size
+        )
+        CartItem.objects.bulk_create(
+            [
+                CartItem(cart_id=cart.id, product_id=product_id, quantity=rng.randint(1, 5))
+                for cart in cart_objs
+                for product_id in rng.sample(product_ids, min(len(product_ids), rng.randint(1, 10)))
+            ],
+            batch_size=batch_size,
+        )
+
+        # (user, product) is unique, so draw distinct pairs.
+        pairs = set()
+        limit = min(reviews, len(user_ids) * len(product_ids))
+        while len(pairs) < limit:
+            pairs.add((rng.choice(user_ids), rng.choice(product_ids)))
+        Reviews.objects.bulk_create(
+            [Reviews(user_id=user_id, product_id=product_id, rating=rng.randint(1, 5)) for user_id, product_id in pairs],
+            batch_size=batch_size,
+        )
+
+        order_objs = Order.objects.bulk_create(
+            [
+                Order(
+                    stripe_checkout_id=f"bench_{run}_{i}",
+                    amount=Decimal(rng.randint(500, 50_000)) / 100,
+                    currency="usd",
+                    customer_email=user_objs[rng.randrange(len(user_objs))].email if user_objs else "guest@example.com",
+                    status="Paid",
+                )
+                for i in range(orders)
+            ],
+            batch_size=batch_size,
+        )
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(order_id=order.id, product_id=product_id, quantity=rng.randint(1, 3))
+                for order in order_objs
+                for product_id in rng.sample(product_ids, min(len(product_ids), rng.randint(1, 4)))
+            ],
+            batch_size=batch_size,
+        )
+
+        # bulk_create skips signals, so derived data is rebuilt in bulk.
+        ratings.rebuild_ratings()
+        search.index_products(product_ids)
+    catalog_cache.invalidate('product', 'category')
+    conditional.bump()
+
+    return {
+        "categories": len(category_ids), "products": len(product_ids), "users": len(user_ids),
+        "carts": len(cart_objs), "reviews": len(pairs), "orders": len(order_objs),
+    }
+
+
+Endpoint = namedtuple('Endpoint', ['name', 'method', 'path', 'body', 'headers'], defaults=[None, None])
+
+
+def _json(data):
+    return json.dumps(data)
+
+
+def _webhook_event(f):
+    return _json({
+        'id': 'evt_benchmark', 'object': 'event', 'type': 'checkout.session.completed',
+        'data': {'object': {
+            'id': 'cs_benchmark', 'amount_total': 1000, 'currency': 'usd',
+            'customer_email': f['user'].email, 'metadata': {'cart_code': f['cart'].cart_code},
+        }},
+    })
+
+
+def _webhook_headers(f):
+    timestamp = int(time.time())
+    payload = f"{timestamp}.{_webhook_event(f)}".encode()
+    signature = hmac.new(WEBHOOK_SECRET.encode(), payload, hashlib.sha256).hexdigest()
+    return {'Stripe-Signature': f"t={timestamp},v1={signature}"}
+
+
+def _export_headers(f):
+    return {'Authorization': f"Bearer {EXPORT_TOKEN}"}
+
+
+ENDPOINTS = [
+    Endpoint('product_list', 'get', lambda f: reverse('product_list')),
+    Endpoint('product_list_not_modified', 'get', lambda f: reverse('product_list'),
+             headers=lambda f: {'If-None-Match': '*'}),
+    Endpoint('product_detail', 'get', lambda f: reverse('product_detail', args=[f['product'].slug])),
+    Endpoint('product_reviews', 'get', lambda f: reverse('product_reviews', args=[f['review'].product.slug])),
+    Endpoint('category_list', 'get', lambda f: reverse('category_list')),
+    Endpoint('category_detail', 'get', lambda f: reverse('category_detail', args=[f['category'].slug])),
+    Endpoint('add_to_cart', 'post', lambda f: reverse('add_to_cart'),
+             lambda f: _json({'cart_code': f['cart'].cart_code, 'product_id': f['product'].id})),
+    Endpoint('get_cart', 'get', lambda f: reverse('get_cart', args=[f['cart'].cart_code])),
+    Endpoint('get_cart_stat', 'get', lambda f: reverse('get_cart_stat', args=[f['cart'].cart_code])),
+    Endpoint('cart_batch', 'post', lambda f: reverse('cart_batch'),
+             lambda f: _json({'cart_code': f['cart'].cart_code, 'operations': [
+                 {'op': 'add', 'product_id': product_id, 'quantity': 2} for product_id in f['product_ids']
+             ] + [{'op': 'remove', 'product_id': f['cartitem'].product_id}]})),
+    Endpoint('update_cartitem_quantity', 'put', lambda f: reverse('update_cartitem_quantity'),
+             lambda f: _json({'cartitem_id': f['cartitem'].id, 'quantity': 3})),
+    Endpoint('add_review', 'post', lambda f: reverse('add_review'),
+             lambda f: _json({'product_id': f['product'].id, 'email': f['user'].email, 'rating': 4, 'comment': 'Good'})),
+    Endpoint('update_review', 'put', lambda f: reverse('update_review', args=[f['review'].id]),
+             lambda f: _json({'rating': 2, 'comment': 'Changed my mind'})),
+    Endpoint('delete_review', 'delete', lambda f: reverse('delete_review', args=[f['review'].id])),
+    Endpoint('delete_cartitem', 'delete', lambda f: reverse('delete_cartitem', args=[f['cartitem'].id])),
+    Endpoint('add_to_wishlist', 'post', lambda f: reverse('add_to_wishlist'),
+             lambda f: _json({'email': f['user'].email, 'product_id': f['product'].id})),
+    Endpoint('toggle_wishlist', 'post', lambda f: reverse('toggle_wishlist'),
+             lambda f: _json({'email': f['user'].email, 'product_id': f['product'].id})),
+    Endpoint('list_wishlist', 'get', lambda f: reverse('list_wishlist', args=[f['user'].email])),
+    Endpoint('wishlist_status', 'get', lambda f: reverse('wishlist_status', args=[f['user'].email])
+             + '?product_ids=' + ','.join(map(str, f['product_ids']))),
+    Endpoint('search', 'get', lambda f: reverse('search') + f"?query={f['term']}"),
+    Endpoint('orders', 'get', lambda f: reverse('orders')),
+    Endpoint('export', 'get', lambda f: reverse('export', args=['products']), headers=_export_headers),
+    Endpoint('export_reviews_ndjson', 'get', lambda f: reverse('export', args=['reviews']) + '?format=ndjson',
+             headers=_export_headers),
+    Endpoint('list_orders_by_email', 'get', lambda f: reverse('list_orders_by_email', args=[f['order_email']])),
+    Endpoint('create_user', 'post', lambda f: reverse('create_user'),
+             lambda f: _json({'username': 'bench-new-user', 'email': 'bench-new-user@example.com', 'first_name': 'Bench',
+                              'last_name': 'User', 'password': 'x'})),
+    Endpoint('existing_user', 'get', lambda f: reverse('existing_user', args=[f['user'].email])),
+    Endpoint('create_checkout_session', 'post', lambda f: reverse('create_checkout_session'),
+             lambda f: _json({'cart_code': f['cart'].cart_code, 'email': f['user'].email})),
+    Endpoint('webhook', 'post', lambda f: reverse('webhook'), _webhook_event, _webhook_headers),
+    Endpoint('async_product_list', 'get', lambda f: reverse('async_product_list')),
+    Endpoint('async_product_detail', 'get', lambda f: reverse('async_product_detail', args=[f['product'].slug])),
+    Endpoint('async_category_list', 'get', lambda f: reverse('async_category_list')),
+    Endpoint('async_search', 'get', lambda f: reverse('async_search') + f"?query={f['term']}"),
+    Endpoint('async_create_checkout_session', 'post', lambda f: reverse('async_create_checkout_session'),
+             lambda f: _json({'cart_code': f['cart'].cart_code, 'email': f['user'].email})),
+    Endpoint('metrics', 'get', lambda f: reverse('metrics')),
+    Endpoint('schema-swagger-ui', 'get', lambda f: reverse('schema-swagger-ui')),
+    Endpoint('schema-redoc', 'get', lambda f: reverse('schema-redoc')),
+]
+
+
+def build_fixture():
+    product = Product.objects.filter(featured=True, category__isnull=False).order_by('id').first()
+    cart = Cart.objects.filter(cartitems__isnull=False).order_by('id').first()
+    user, _ = CustomUser.objects.get_or_create(username='bench-runner', defaults={'email': 'bench-runner@example.com'})
+    return {
+        'product': product,
+        'product_ids': list(Product.objects.order_by('id').values_list('id', flat=True)[:20]),
+        'category': product.category,
+        'cart': cart,
+        'cartitem': cart.cartitems.order_by('id').first(),
+        'review': Reviews.objects.select_related('product').order_by('id').first(),
+        'user': user,
+        'order_email': Order.objects.order_by('id').values_list('customer_email', flat=True).first(),
+        'term': product.name.split()[0][:4].lower(),
+    }
+
+
+def _fake_checkout_session(**params):
+    return {'id': 'cs_benchmark', 'object': 'checkout.session', 'url': 'https://checkout.stripe.com/benchmark'}
+
+
+def _consume(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def call(client, endpoint, fixture):
+    kwargs = {}
+    if endpoint.body is not None:
+        kwargs = {'data': endpoint.body(fixture), 'content_type': 'application/json'}
+    if endpoint.headers is not None:
+        kwargs['headers'] = endpoint.headers(fixture)
+    # Every call is rolled back so each iteration sees the same data.
+    with transaction.atomic():
+        response = getattr(client, endpoint.method)(endpoint.path(fixture), **kwargs)
+        size = _consume(response)
+        transaction.set_rollback(True)
+    return response, size
+
+
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+def count_queries(captured):
+    # Transaction bookkeeping depends on who opened the outer transaction
+    # (the runner or a TestCase), so only real statements count.
+    return sum(1 for query in captured if not query['sql'].startswith(TRANSACTION_CONTROL))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(client, endpoint, fixture, iterations):
+    # First call is cold (empty caches) and decides the query count.
+    with CaptureQueriesContext(connection) as queries:
+        response, size = call(client, endpoint, fixture)
+    query_count = count_queries(queries.captured_queries)
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        call(client, endpoint, fixture)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    call(client, endpoint, fixture)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'method': endpoint.method.upper(),
+        'path': endpoint.path(fixture),
+        'status': response.status_code,
+        'queries': query_count,
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'peak_kb': round(peak / 1024, 1),
+        'response_bytes': size,
+        'iterations': iterations,
+    }
+
+
+def run_benchmarks(iterations=20, only=None):
+    fixture = build_fixture()
+    # A failing view is reported as a 500 result rather than aborting the run.
+    client = Client(raise_request_exception=False)
+    results = {}
+    # The manifest storage needs collectstatic output, which a benchmark
+    # (or test) run doesn't have; the swagger pages only need static URLs.
+    storages = {**settings.STORAGES, 'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    }}
+    with mock.patch.object(views, 'endpoint_secret', WEBHOOK_SECRET), \
+            mock.patch('stripe.checkout.Session.create', _fake_checkout_session), \
+            override_settings(STORAGES=storages, EXPORT_TOKEN=EXPORT_TOKEN):
+        for endpoint in ENDPOINTS:
+            if only and endpoint.name not in only:
+                continue
+            catalog_cache.get_cache().clear()
+            results[endpoint.name] = measure(client, endpoint, fixture, iterations)
+    return results
+
+
+def load_budgets(path=BUDGETS_PATH):
+    with open(path) as budgets:
+        return json.load(budgets)
+
+
+def check_budgets(results, budgets):
+    from .urls import urlpatterns
+
+    problems = []
+    routes = {pattern.name for pattern in urlpatterns if pattern.name}
+    covered = {endpoint.name for endpoint in ENDPOINTS}
+    for name in sorted(routes - covered):
+        problems.append(f"{name}: route has no benchmark")
+    for name, result in results.items():
+        if result['status'] >= 500:
+            problems.append(f"{name}: returned {result['status']}")
+        if name not in budgets:
+            problems.append(f"{name}: no query budget")
+        elif result['queries'] > budgets[name]:
+            problems.append(f"{name}: {result['queries']} queries, budget is {budgets[name]}")
+    return problems
+
+
+def serializer_throughput(rows=10_000, repeat=5):
+    """
+    Rows/sec for rendering ``rows`` products as JSON, through
+    ProductListSerializer and through the fastpath row mapping (query
+    included). Reports the best of ``repeat`` runs for each.
+    """
+    renderer = JSONRenderer()
+    products = Product.objects.order_by('id')[:rows]
+
+    def serializer_path():
+        queryset = products.only(*ProductListSerializer.Meta.fields)
+        return renderer.render(ProductListSerializer(queryset, many=True).data)
+
+    def fast_path():
+        return renderer.render(product_rows.many(product_rows.values(products)))
+
+    results = {}
+    for name, render in (('serializer', serializer_path), ('fastpath', fast_path)):
+        best = min(_timed(render) for _ in range(repeat))
+        results[name] = {'seconds': round(best, 4), 'rows_per_sec': round(rows / best)}
+    results['speedup'] = round(results['serializer']['seconds'] / results['fastpath']['seconds'], 2)
+    results['identical'] = serializer_path() == fast_path()
+    return results
+
+
+def _timed(func):
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
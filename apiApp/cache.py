@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+# Catalog reads are cached per namespace ("product", "category") under
+# versioned keys: invalidating a namespace bumps its version, which orphans
+# every key built with the old one. Orphans simply expire.
+# Keys also carry the CatalogVersion stamp that catalog_condition loaded for
+# the request (request.catalog_version). Namespace versions live in the
+# cache, so with a per-process cache an invalidation only reaches the worker
+# that made the write; the stamp is read from the database, so a write made
+# anywhere moves every worker onto new keys and no stale body is served
+# under the new ETag.
+
+LOCK_SUFFIX = ':lock'
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _version_key(namespace):
+    return f"catalog:{namespace}:version"
+
+
+def get_version(namespace):
+    cache = get_cache()
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # Seed from the clock so an evicted version never resurrects keys
+        # written under an earlier one.
+        cache.add(_version_key(namespace), time.time_ns() // 1000, timeout=None)
+        version = cache.get(_version_key(namespace))
+    return version
+
+
+def make_key(namespace, ident, catalog_version):
+    return f"catalog:{namespace}:v{get_version(namespace)}:c{catalog_version}:{ident}"
+
+
+def invalidate(*namespaces):
+    cache = get_cache()
+    for namespace in namespaces:
+        try:
+            cache.incr(_version_key(namespace))
+        except ValueError:
+            cache.set(_version_key(namespace), time.time_ns() // 1000, timeout=None)
+
+
+def get_or_build(namespace, ident, builder, catalog_version):
+    """
+    Read-through lookup. On a miss only one caller (the one that wins the
+    lock) runs ``builder``; the others wait for it to fill the key instead
+    of sending the same query to the database.
+    """
+    cache = get_cache()
+    key = make_key(namespace, ident, catalog_version)
+
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = key + LOCK_SUFFIX
+    owns_lock = cache.add(lock_key, 1, timeout=settings.CATALOG_CACHE_LOCK_TIMEOUT)
+    if not owns_lock:
+        deadline = time.monotonic() + settings.CATALOG_CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(settings.CATALOG_CACHE_LOCK_POLL)
+            value = cache.get(key)
+            if value is not None:
+                return value
+        # The lock holder died or is too slow; build it ourselves.
+
+    try:
+        value = builder()
+        cache.set(key, value, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    finally:
+        if owns_lock:
+            cache.delete(lock_key)
+    return value
+
+
+
+async def aget_version(namespace):
+    cache = get_cache()
+    version = await cache.aget(_version_key(namespace))
+    if version is None:
+        await cache.aadd(_version_key(namespace), time.time_ns() // 1000, timeout=None)
+        version = await cache.aget(_version_key(namespace))
+    return version
+
+
+async def aget_or_build(namespace, ident, builder, catalog_version):
+    """
+    Async twin of get_or_build for ASGI views; ``builder`` is a coroutine
+    function and waiting on another caller's lock yields the event loop.
+    """
+    cache = get_cache()
+    key = f"catalog:{namespace}:v{await aget_version(namespace)}:c{catalog_version}:{ident}"
+
+    value = await cache.aget(key)
+    if value is not None:
+        return value
+
+    lock_key = key + LOCK_SUFFIX
+    owns_lock = await cache.aadd(lock_key, 1, timeout=settings.CATALOG_CACHE_LOCK_TIMEOUT)
+    if not owns_lock:
+        deadline = time.monotonic() + settings.CATALOG_CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(settings.CATALOG_CACHE_LOCK_POLL)
+            value = await cache.aget(key)
+            if value is not None:
+                return value
+
+    try:
+        value = await builder()
+        await cache.aset(key, value, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    finally:
+        if owns_lock:
+            await cache.adelete(lock_key)
+    return value
@@ -0,0 +1,132 @@
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Cart, CartItem, Product
+
+
+class CartOperationError(ValueError):
+    pass
+
+
+OPERATIONS = ('add', 'set', 'remove')
+
+
+def open_cart(cart_code):
+    """
+    Get or create the cart for ``cart_code`` and mark it active, in one
+    upsert on the unique cart_code. Returns the cart id. Carts idle past
+    CART_RETENTION_DAYS are removed by apiApp.retention.
+    """
+    [cart] = Cart.objects.bulk_create(
+        [Cart(cart_code=cart_code)], update_conflicts=True, unique_fields=['cart_code'], update_fields=['updated_at'],
+    )
+    return cart.pk
+
+
+def touch_cart(cart_id):
+    Cart.objects.filter(pk=cart_id).update(updated_at=timezone.now())
+
+
+def upsert_items(cart_id, quantities, increment=True):
+    """
+    Write {product_id: quantity} into a cart in one statement, relying on
+    the (cart, product) unique constraint: with ``increment`` the quantity
+    is added to an existing line (atomically, in SQL), otherwise it
+    replaces it. Concurrent callers can't lose updates or duplicate lines.
+    """
+    if not quantities:
+        return
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for product_id, quantity in quantities.items():
+            _upsert_item_fallback(cart_id, product_id, quantity, increment)
+        return
+
+    table = connection.ops.quote_name(CartItem._meta.db_table)
+    new_quantity = f'{table}.quantity + excluded.quantity' if increment else 'excluded.quantity'
+    values = ', '.join(['(%s, %s, %s)'] * len(quantities))
+    params = []
+    for product_id, quantity in quantities.items():
+        params += [cart_id, product_id, quantity]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (cart_id, product_id, quantity) VALUES {values} '
+            f'ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {new_quantity}',
+            params,
+        )
+
+
+def _upsert_item_fallback(cart_id, product_id, quantity, increment):
+    new_quantity = F('quantity') + quantity if increment else quantity
+    if CartItem.objects.filter(cart_id=cart_id, product_id=product_id).update(quantity=new_quantity):
+        return
+    try:
+        with transaction.atomic():
+            CartItem.objects.create(cart_id=cart_id, product_id=product_id, quantity=quantity)
+    except IntegrityError:
+        CartItem.objects.filter(cart_id=cart_id, product_id=product_id).update(quantity=new_quantity)
+
+
+def add_item(cart_id, product_id, quantity=1):
+    upsert_items(cart_id, {product_id: quantity}, increment=True)
+
+
+def _positive_int(value, field, minimum):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise CartOperationError(f"'{field}' must be an integer")
+    if value < minimum:
+        raise CartOperationError(f"'{field}' must be at least {minimum}")
+    return value
+
+
+def plan_operations(operations):
+    """
+    Fold an ordered list of operations into one final action per product:
+    ('add', n) adds n to whatever is in the cart, ('set', n) replaces it
+    (n == 0 removes the line).
+    """
+    plan = {}
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise CartOperationError("Each operation must be an object")
+        op = operation.get('op')
+        if op not in OPERATIONS:
+            raise CartOperationError(f"'op' must be one of {', '.join(OPERATIONS)}")
+        product_id = _positive_int(operation.get('product_id'), 'product_id', 1)
+
+        if op == 'add':
+            quantity = _positive_int(operation.get('quantity', 1), 'quantity', 1)
+            action, current = plan.get(product_id, ('add', 0))
+            plan[product_id] = (action, current + quantity)
+        elif op == 'set':
+            quantity = _positive_int(operation.get('quantity'), 'quantity', 0)
+            plan[product_id] = ('set', quantity)
+        else:
+            plan[product_id] = ('set', 0)
+    return plan
+
+
+def apply_operations(cart_code, operations):
+    plan = plan_operations(operations)
+
+    wanted = [product_id for product_id, (action, quantity) in plan.items() if quantity > 0]
+    known = set(Product.objects.filter(id__in=wanted).values_list('id', flat=True))
+    unknown = sorted(set(wanted) - known)
+    if unknown:
+        raise CartOperationError(f"Unknown product ids: {', '.join(map(str, unknown))}")
+
+    with transaction.atomic():
+        cart_id = open_cart(cart_code)
+        upsert_items(cart_id, {
+            product_id: quantity for product_id, (action, quantity) in plan.items() if action == 'add'
+        }, increment=True)
+        upsert_items(cart_id, {
+            product_id: quantity for product_id, (action, quantity) in plan.items() if action == 'set' and quantity > 0
+        }, increment=False)
+        removed = [product_id for product_id, (action, quantity) in plan.items() if action == 'set' and quantity == 0]
+        if removed:
+            CartItem.objects.filter(cart_id=cart_id, product_id__in=removed).delete()
+
+    return Cart.objects.with_items().get(pk=cart_id)
@@ -0,0 +1,215 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+
+from .models import Category, Product
+from .slugs import SAVE_ATTEMPTS as SLUG_ATTEMPTS, allocate_slugs
+from . import cache as catalog_cache
+from . import conditional
+from . import media_tasks
+from . import search
+
+
+# Bulk catalog import/export (manage.py import_catalog / export_catalog).
+# Rows are keyed by product slug: a row whose slug exists updates that
+# product, anything else creates one. Files are read and written as a
+# stream, BATCH_SIZE rows at a time.
+
+COLUMNS = ['slug', 'name', 'description', 'price', 'category', 'featured', 'image']
+UPDATE_FIELDS = ['name', 'description', 'price', 'category', 'featured', 'image']
+BATCH_SIZE = 2_000
+MAX_PRICE = Decimal('100000000')  # max_digits=10, decimal_places=2
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f', ''}
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _text(row, key, required=False):
+    value = row.get(key)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f"'{key}' is required")
+    return value
+
+
+def parse_row(row):
+    if not isinstance(row, dict):
+        raise RowError("Row must be a JSON object")
+    slug = slugify(_text(row, 'slug'))
+    if len(slug) > Product._meta.get_field('slug').max_length:
+        raise RowError("'slug' is too long")
+    name = _text(row, 'name', required=True)
+    try:
+        price = Decimal(_text(row, 'price', required=True))
+    except InvalidOperation:
+        raise RowError("'price' must be a number")
+    if not price.is_finite() or not 0 <= price < MAX_PRICE:
+        raise RowError(f"'price' must be between 0 and {MAX_PRICE}")
+    price = price.quantize(Decimal('0.01'))
+
+    featured = row.get('featured', True)
+    if not isinstance(featured, bool):
+        featured = _text(row, 'featured').lower() or 'true'
+        if featured not in TRUE_VALUES | FALSE_VALUES:
+            raise RowError("'featured' must be true or false")
+        featured = featured in TRUE_VALUES
+
+    return {
+        'slug': slug,
+        'name': name,
+        'description': _text(row, 'description'),
+        'price': price,
+        'category': _text(row, 'category'),
+        'featured': featured,
+        'image': _text(row, 'image') or None,
+    }
+
+
+class CatalogImporter:
+    def __init__(self, create_categories=False, batch_size=BATCH_SIZE):
+        self.create_categories = create_categories
+        self.batch_size = batch_size
+        # Category slug -> id, loaded once and kept in memory.
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.created = self.updated = 0
+        self.errors = []
+
+    def run(self, rows):
+        line = 0
+        for batch in batches(rows, self.batch_size):
+            parsed = []
+            for row in batch:
+                line += 1
+                try:
+                    parsed.append((line, parse_row(row)))
+                except RowError as e:
+                    self.errors.append((line, str(e)))
+            self.import_batch(parsed)
+
+        catalog_cache.invalidate('product', 'category')
+        conditional.bump()
+        return self
+
+    def resolve_categories(self, parsed):
+        missing = {data['category'] for line, data in parsed if data['category'] and data['category'] not in self.categories}
+        if missing and self.create_categories:
+            Category.objects.bulk_create(
+                [Category(name=slug.replace('-', ' ').title(), slug=slug) for slug in sorted(missing)],
+                ignore_conflicts=True,
+            )
+            self.categories.update(Category.objects.filter(slug__in=missing).values_list('slug', 'id'))
+
+        resolved = []
+        for line, data in parsed:
+            category = data.pop('category')
+            if category and category not in self.categories:
+                self.errors.append((line, f"Unknown category '{category}'"))
+                continue
+            data['category_id'] = self.categories.get(category)
+            resolved.append((line, data))
+        return resolved
+
+    def import_batch(self, parsed):
+        rows = self.resolve_categories(parsed)
+        if not rows:
+            return
+        # A concurrent writer can take a slug between allocation and insert;
+        # the batch then rolls back and is planned again from fresh data.
+        for attempt in range(SLUG_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    errors, created, updated = self.write_batch(rows)
+                break
+            except IntegrityError:
+                if attempt == SLUG_ATTEMPTS - 1:
+                    raise
+        self.errors.extend(errors)
+        self.created += created
+        self.updated += updated
+
+    def write_batch(self, rows):
+        slugs = {data['slug'] for line, data in rows if data['slug']}
+        existing, images = {}, {}
+        for slug, pk, image in Product.objects.filter(slug__in=slugs).values_list('slug', 'id', 'image'):
+            existing[slug], images[slug] = pk, image or ''
+
+        errors, to_update, to_create, seen = [], [], [], set()
+        for line, data in rows:
+            slug = data['slug']
+            if slug in seen:
+                errors.append((line, f"Duplicate slug '{slug}' in batch"))
+                continue
+            if slug:
+                seen.add(slug)
+            if slug in existing:
+                to_update.append(Product(**data))
+            else:
+                to_create.append(Product(**data))
+
+        # Explicit slugs (already known to be free) are kept; the rest get a
+        # slug from their name, allocated for the whole batch at once.
+        explicit = {product.slug for product in to_create if product.slug}
+        unnamed = [product for product in to_create if not product.slug]
+        for product, slug in zip(unnamed, allocate_slugs(Product, [p.name for p in unnamed], reserved=explicit)):
+            product.slug = slug
+
+        created = Product.objects.bulk_create(to_create, batch_size=self.batch_size)
+        # Updates are an upsert on the unique slug: one statement per batch
+        # instead of bulk_update's CASE WHEN per row and field.
+        Product.objects.bulk_create(to_update, batch_size=self.batch_size, update_conflicts=True,
+                                    unique_fields=['slug'], update_fields=UPDATE_FIELDS)
+        # The upsert can't set image_variants per row, so the variants of
+        # replaced or removed images are cleared here, before any new build.
+        replaced = [existing[p.slug] for p in to_update if (p.image.name or '') != images[p.slug]]
+        if replaced:
+            Product.objects.filter(pk__in=replaced).update(image_variants={})
+        # Bulk writes skip signals, so the search index is fed here.
+        search.index_products([product.pk for product in created] + [existing[product.slug] for product in to_update])
+        media_tasks.enqueue(Product, [(product.pk, product.image.name) for product in created if product.image] +
+                            [(existing[product.slug], product.image.name) for product in to_update if product.image])
+        return errors, len(created), len(to_update)
+
+
+def export_rows(chunk_size=BATCH_SIZE):
+    products = Product.objects.order_by('id').values_list(
+        'slug', 'name', 'description', 'price', 'category__slug', 'featured', 'image')
+    for slug, name, description, price, category, featured, image in products.iterator(chunk_size=chunk_size):
+        yield {
+            'slug': slug, 'name': name, 'description': description, 'price': f'{price:.2f}',
+            'category': category or '', 'featured': featured, 'image': image or '',
+        }
+
+
+def write_rows(stream, rows, fmt):
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            stream.write(json.dumps(row, ensure_ascii=False) + '\n')
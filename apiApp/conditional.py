@@ -0,0 +1,118 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .cache import get_cache
+from .models import CatalogVersion
+
+
+# Conditional GET for the catalog endpoints. Every Product/Category change
+# bumps one CatalogVersion row; the stamp is cached next to the catalog, so
+# a client revalidating with If-None-Match / If-Modified-Since gets a 304
+# without the view building a queryset or running a serializer.
+# A bump can only drop the cached stamp from a cache every worker shares.
+# With a per-process cache CATALOG_STAMP_TIMEOUT is 0 and the stamp is read
+# from its row on each request, or other workers would keep answering 304
+# for data that has changed.
+
+STAMP_KEY = 'catalog:stamp'
+
+
+def _load_stamp():
+    row, _ = CatalogVersion.objects.get_or_create(pk=1)
+    return row.version, row.updated_at
+
+
+def get_stamp():
+    if not settings.CATALOG_STAMP_TIMEOUT:
+        return _load_stamp()
+    cache = get_cache()
+    stamp = cache.get(STAMP_KEY)
+    if stamp is None:
+        stamp = _load_stamp()
+        cache.add(STAMP_KEY, stamp, timeout=settings.CATALOG_STAMP_TIMEOUT)
+    return stamp
+
+
+async def _aload_stamp():
+    row, _ = await CatalogVersion.objects.aget_or_create(pk=1)
+    return row.version, row.updated_at
+
+
+async def aget_stamp():
+    if not settings.CATALOG_STAMP_TIMEOUT:
+        return await _aload_stamp()
+    cache = get_cache()
+    stamp = await cache.aget(STAMP_KEY)
+    if stamp is None:
+        stamp = await _aload_stamp()
+        await cache.aadd(STAMP_KEY, stamp, timeout=settings.CATALOG_STAMP_TIMEOUT)
+    return stamp
+
+
+def _forget_stamp():
+    get_cache().delete(STAMP_KEY)
+
+
+def bump():
+    """
+    Advance the catalog version. Call it after bulk writes, which skip the
+    model signals.
+    """
+    updated = CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1, updated_at=timezone.now())
+    if not updated:
+        CatalogVersion.objects.get_or_create(pk=1, defaults={'version': 2})
+    # A reader inside the writer's transaction window may re-cache the old
+    # stamp, so it is dropped again once the change is visible.
+    _forget_stamp()
+    transaction.on_commit(_forget_stamp)
+
+
+def etag(version):
+    return f'"catalog-{version}"'
+
+
+def _not_modified(request, stamp):
+    version, updated_at = stamp
+    return get_conditional_response(request, etag=etag(version), last_modified=int(updated_at.timestamp()))
+
+
+def _add_headers(response, stamp):
+    version, updated_at = stamp
+    if response.status_code == 200:
+        response.headers.setdefault('ETag', etag(version))
+        response.headers.setdefault('Last-Modified', http_date(updated_at.timestamp()))
+    return response
+
+
+def catalog_condition(view):
+    """
+    Like django.views.decorators.http.condition, with the ETag and
+    Last-Modified taken from the catalog stamp; works on async views too.
+    The view finds the stamp's version in ``request.catalog_version``.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            stamp = await aget_stamp()
+            request.catalog_version = stamp[0]
+            response = _not_modified(request, stamp)
+            if response is None:
+                response = _add_headers(await view(request, *args, **kwargs), stamp)
+            return response
+    else:
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            stamp = get_stamp()
+            request.catalog_version = stamp[0]
+            response = _not_modified(request, stamp)
+            if response is None:
+                response = _add_headers(view(request, *args, **kwargs), stamp)
+            return response
+    return inner
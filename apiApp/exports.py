@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from .models import Order, OrderItem, Product, Reviews
+from .serializers import OrderItemExportSerializer, OrderSerializer, ProductDetailSerializer, ReviewExportSerializer
+
+
+# Full-table exports streamed as a JSON array or NDJSON. Rows are read
+# with .iterator(chunk_size) and serialized one chunk at a time, so memory
+# use depends on EXPORT_CHUNK_SIZE rather than on the size of the table.
+
+EXPORTS = {
+    'orders': (
+        lambda: Order.objects.prefetch_related(Prefetch('items', queryset=OrderItem.objects.order_by('id'))),
+        OrderSerializer,
+    ),
+    'orderitems': (lambda: OrderItem.objects.all(), OrderItemExportSerializer),
+    'products': (lambda: Product.objects.all(), ProductDetailSerializer),
+    'reviews': (lambda: Reviews.objects.select_related('user'), ReviewExportSerializer),
+}
+
+FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+renderer = JSONRenderer()
+
+
+def queryset_for(resource):
+    return EXPORTS[resource][0]().order_by('id')
+
+
+def chunks(queryset, serializer_class, chunk_size):
+    chunk = []
+    # prefetch_related is applied per chunk when iterator() gets a chunk_size.
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(instance)
+        if len(chunk) == chunk_size:
+            yield serializer_class(chunk, many=True).data
+            chunk = []
+    if chunk:
+        yield serializer_class(chunk, many=True).data
+
+
+def stream(resource, fmt='json', queryset=None, chunk_size=None):
+    """
+    Yield the export of ``resource`` as bytes. ``queryset`` narrows the
+    default one (e.g. by date); ``fmt`` is "json" (one array) or "ndjson".
+    """
+    serializer_class = EXPORTS[resource][1]
+    queryset = queryset_for(resource) if queryset is None else queryset
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+
+    if fmt == 'ndjson':
+        for data in chunks(queryset, serializer_class, chunk_size):
+            yield b''.join(renderer.render(item) + b'\n' for item in data)
+        return
+
+    yield b'['
+    first = True
+    for data in chunks(queryset, serializer_class, chunk_size):
+        # Render the chunk as one array and drop its brackets.
+        body = renderer.render(data)[1:-1]
+        yield body if first else b',' + body
+        first = False
+    yield b']'
@@ -0,0 +1,82 @@
+from functools import cached_property
+
+from rest_framework import serializers
+
+from .serializers import CategoryDetailSerializer, ImageVariantsField, ProductListSerializer, variant_urls
+
+
+# Opt-in fast serialization for read-only list endpoints (FAST_SERIALIZATION).
+# Rows come straight from .values() and go through a field mapping compiled
+# once from the ModelSerializer, instead of instantiating fields per object.
+# The output is the same JSON the serializer produces, so clients can't
+# tell which path served them.
+
+# Field types whose representation of a database value is the value itself.
+PASSTHROUGH = (serializers.CharField, serializers.IntegerField, serializers.BooleanField)
+
+
+class RowSerializer:
+    """
+    Turns ``.values()`` rows into the dicts ``serializer_class`` would build.
+    Only plain model fields and ImageVariantsField are supported (no nested
+    or method fields), and
+    serializer context is not used, so file URLs stay relative just like
+    the serializer without a request in its context.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @cached_property
+    def mapping(self):
+        serializer = self.serializer_class()
+        model = self.serializer_class.Meta.model
+        mapping = []
+        for name, field in serializer.fields.items():
+            if isinstance(field, ImageVariantsField):
+                # Reads two columns: the variants and the image they must match.
+                mapping.append((name, ('image_variants', 'image'), variant_urls))
+                continue
+            if isinstance(field, serializers.FileField):
+                storage = model._meta.get_field(field.source).storage
+                convert = lambda value, storage=storage: storage.url(value) if value else None
+            elif isinstance(field, PASSTHROUGH):
+                convert = None
+            else:
+                convert = field.to_representation
+            mapping.append((name, field.source, convert))
+        return mapping
+
+    @cached_property
+    def sources(self):
+        sources = []
+        for name, source, convert in self.mapping:
+            sources.extend(source if isinstance(source, tuple) else [source])
+        return list(dict.fromkeys(sources))
+
+    def values(self, queryset):
+        return queryset.values(*self.sources)
+
+    def to_representation(self, row):
+        data = {}
+        for name, source, convert in self.mapping:
+            if isinstance(source, tuple):
+                data[name] = convert(*(row[column] for column in source))
+                continue
+            value = row[source]
+            data[name] = value if value is None or convert is None else convert(value)
+        return data
+
+    def many(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
+product_rows = RowSerializer(ProductListSerializer)
+
+
+def category_detail(category):
+    products = product_rows.values(category.products.order_by('id'))
+    data = {}
+    for name in CategoryDetailSerializer.Meta.fields:
+        data[name] = product_rows.many(products) if name == 'products' else getattr(category, name)
+    return data
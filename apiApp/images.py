@@ -0,0 +1,94 @@
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+
+# Responsive variants of Product and Category images. Each original is
+# resized to IMAGE_VARIANT_WIDTHS (never upscaled) in every format of
+# IMAGE_VARIANT_FORMATS and stored under variants/, named after a digest of
+# the original's bytes: the same picture uploaded twice, or processed again,
+# writes nothing new. The model's image_variants field records the result
+# as {"source": <image name>, <format>: {<width>: <variant name>}}.
+# This module only touches storage, never the database, so it can run in
+# pool processes.
+
+VARIANT_DIR = 'variants'
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def variant_name(digest, width, fmt):
+    return f'{VARIANT_DIR}/{digest[:2]}/{digest}-{width}.{EXTENSIONS[fmt]}'
+
+
+def target_widths(width):
+    widths = [w for w in settings.IMAGE_VARIANT_WIDTHS if w <= width]
+    return widths or [width]
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def encode(image, width, fmt):
+    """``image`` resized to ``width`` and encoded as ``fmt``, without EXIF or ICC metadata."""
+    height = max(1, round(image.height * width / image.width))
+    resized = image.resize((width, height), Image.Resampling.LANCZOS)
+    if fmt == 'jpeg' and resized.mode == 'RGBA':
+        flattened = Image.new('RGB', resized.size, 'white')
+        flattened.paste(resized, mask=resized.getchannel('A'))
+        resized = flattened
+    buffer = io.BytesIO()
+    resized.save(buffer, fmt.upper(), quality=settings.IMAGE_VARIANT_QUALITY, optimize=fmt == 'jpeg')
+    return buffer.getvalue()
+
+
+def build_variants(name, storage=None, overwrite=False):
+    """Variants of the stored image ``name``; ``overwrite`` re-encodes existing files."""
+    storage = storage or default_storage
+    with storage.open(name, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    with Image.open(io.BytesIO(data)) as original:
+        # Apply the EXIF orientation before the metadata is dropped.
+        image = ImageOps.exif_transpose(original)
+        image = image.convert('RGBA' if _has_alpha(image) else 'RGB')
+
+    variants = {'source': name}
+    for fmt in settings.IMAGE_VARIANT_FORMATS:
+        variants[fmt] = {}
+        for width in target_widths(image.width):
+            variant = variant_name(digest, width, fmt)
+            if overwrite:
+                storage.delete(variant)
+            if not storage.exists(variant):
+                variant = storage.save(variant, ContentFile(encode(image, width, fmt)))
+            variants[fmt][str(width)] = variant
+    return variants
+
+
+def render(name, overwrite=False):
+    """
+    Worker entry point (apiApp.media_tasks, rebuild_media). Unreadable
+    images are logged and recorded without variants, so they aren't
+    retried on every run.
+    """
+    try:
+        return build_variants(name, overwrite=overwrite)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning("Could not build variants of %s", name, exc_info=True)
+        return {'source': name}
+
+
+def init_worker():
+    # Spawned (rather than forked) pool processes start without Django set up.
+    import django
+    django.setup()
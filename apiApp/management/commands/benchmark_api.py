@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from apiApp.benchmark import check_budgets, load_budgets, run_benchmarks, seed_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database with a synthetic catalog, benchmark every API route and "
+        "fail if any endpoint exceeds its query budget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100_000)
+        parser.add_argument("--users", type=int, default=2_000)
+        parser.add_argument("--carts", type=int, default=2_000)
+        parser.add_argument("--reviews", type=int, default=50_000)
+        parser.add_argument("--orders", type=int, default=20_000)
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--endpoint", action="append", dest="endpoints",
+                            help="Only benchmark this route name (repeatable).")
+        parser.add_argument("--output", default="bench_output.json", help="Where to write the JSON results.")
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            self.stdout.write("Seeding benchmark catalog...")
+            seed_catalog(products=options["products"], categories=50, users=options["users"],
+                         carts=options["carts"], reviews=options["reviews"], orders=options["orders"])
+            results = run_benchmarks(iterations=options["iterations"], only=options["endpoints"])
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        with open(options["output"], "w") as output:
+            json.dump(results, output, indent=2)
+
+        self.stdout.write(f"{'endpoint':32} {'status':>6} {'queries':>7} {'p50 ms':>9} {'p95 ms':>9} {'peak KB':>9}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:32} {result['status']:>6} {result['queries']:>7} {result['p50_ms']:>9.2f} "
+                f"{result['p95_ms']:>9.2f} {result['peak_kb']:>9.1f}"
+            )
+        self.stdout.write(f"Results written to {options['output']}")
+
+        problems = check_budgets(results, load_budgets())
+        if options["endpoints"]:
+            problems = [p for p in problems if not p.endswith("route has no benchmark")]
+        if problems:
+            raise CommandError("Query budget check failed:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS("All endpoints are within their query budgets."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from apiApp.benchmark import seed_catalog, serializer_throughput
+
+
+class Command(BaseCommand):
+    help = "Compare rows/sec of ProductListSerializer and the FAST_SERIALIZATION row mapping on a throwaway database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            seed_catalog(products=options["rows"], categories=20, users=0, carts=0, reviews=0, orders=0)
+            results = serializer_throughput(rows=options["rows"], repeat=options["repeat"])
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        for name in ("serializer", "fastpath"):
+            self.stdout.write(f"{name:12} {results[name]['rows_per_sec']:>10} rows/sec  ({results[name]['seconds']:.3f}s)")
+        self.stdout.write(f"speedup      {results['speedup']}x")
+        if not results["identical"]:
+            raise CommandError("Fast path output differs from ProductListSerializer.")
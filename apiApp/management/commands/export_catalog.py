@@ -0,0 +1,24 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from apiApp.catalog_io import BATCH_SIZE, export_rows, write_rows
+
+
+class Command(BaseCommand):
+    help = "Export every product as CSV or NDJSON in the format import_catalog reads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+        parser.add_argument("--output", help="File to write (default catalog.<format>), or - for stdout.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        output = options["output"] or f"catalog.{options['format']}"
+        stream = sys.stdout if output == "-" else open(output, "w", newline="", encoding="utf-8")
+        try:
+            write_rows(stream, export_rows(options["batch_size"]), options["format"])
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+                self.stdout.write(self.style.SUCCESS(f"Catalog written to {output}"))
@@ -0,0 +1,45 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apiApp.catalog_io import BATCH_SIZE, CatalogImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Import products from a CSV or NDJSON file (columns: slug, name, description, price, category, "
+        "featured, image). Rows whose slug exists update that product; the rest are created."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to read, or - for stdin.")
+        parser.add_argument("--format", choices=["csv", "ndjson"],
+                            help="Defaults to the file extension (.csv, otherwise NDJSON).")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--create-categories", action="store_true",
+                            help="Create categories for unknown category slugs instead of rejecting the rows.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "ndjson")
+        started = time.perf_counter()
+
+        stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            importer = CatalogImporter(create_categories=options["create_categories"],
+                                       batch_size=options["batch_size"])
+            importer.run(read_rows(stream, fmt))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.perf_counter() - started
+        for line, error in importer.errors[:20]:
+            self.stderr.write(f"row {line}: {error}")
+        if len(importer.errors) > 20:
+            self.stderr.write(f"... and {len(importer.errors) - 20} more")
+        summary = f"Created {importer.created}, updated {importer.updated} products in {elapsed:.1f}s."
+        if importer.errors:
+            raise CommandError(f"{summary} {len(importer.errors)} rows rejected.")
+        self.stdout.write(self.style.SUCCESS(summary))
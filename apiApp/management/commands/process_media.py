@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apiApp import media_tasks
+
+
+class Command(BaseCommand):
+    help = "Build image variants for queued media tasks in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Process the queued tasks once and exit.")
+        parser.add_argument("--batch-size", type=int, default=settings.MEDIA_TASK_BATCH_SIZE)
+        parser.add_argument("--workers", type=int, default=settings.MEDIA_WORKERS,
+                            help="Worker processes (0 renders in this process).")
+        parser.add_argument("--poll-interval", type=float, default=settings.MEDIA_POLL_INTERVAL,
+                            help="Seconds to sleep when the queue is empty.")
+
+    def handle(self, *args, **options):
+        pool = media_tasks.executor(options["workers"])
+        try:
+            while True:
+                processed = media_tasks.process_batch(options["batch_size"], pool)
+                if processed:
+                    self.stdout.write(f"Processed {processed} media tasks.")
+                if options["once"]:
+                    break
+                if not processed:
+                    time.sleep(options["poll_interval"])
+        finally:
+            if pool is not None:
+                pool.shutdown()
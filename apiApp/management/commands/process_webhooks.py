@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apiApp import webhooks
+
+
+class Command(BaseCommand):
+    help = "Process queued Stripe webhook events, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Process the due events once and exit.")
+        parser.add_argument("--batch-size", type=int, default=settings.WEBHOOK_BATCH_SIZE)
+        parser.add_argument("--poll-interval", type=float, default=settings.WEBHOOK_POLL_INTERVAL,
+                            help="Seconds to sleep when the queue is empty.")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = webhooks.process_batch(options["batch_size"])
+            if processed:
+                self.stdout.write(f"Processed {processed} webhook events.")
+            if options["once"]:
+                break
+            if not processed:
+                time.sleep(options["poll_interval"])
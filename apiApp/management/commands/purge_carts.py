@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apiApp import retention
+
+
+class Command(BaseCommand):
+    help = "Delete carts idle for longer than CART_RETENTION_DAYS, in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.CART_RETENTION_DAYS,
+                            help="Delete carts not updated for this many days.")
+        parser.add_argument("--batch-size", type=int, default=settings.CART_PURGE_BATCH_SIZE)
+        parser.add_argument("--pause", type=float, default=settings.CART_PURGE_PAUSE,
+                            help="Seconds to sleep between batches.")
+        parser.add_argument("--interval", type=float,
+                            help="Keep running, purging every this many seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            result = retention.purge_carts(days=options["days"], batch_size=options["batch_size"],
+                                           pause=options["pause"])
+            self.stdout.write(
+                f"Purged {result.carts} carts and {result.items} cart items "
+                f"in {result.batches} batches ({result.seconds:.2f}s)."
+            )
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apiApp import media_tasks
+from apiApp.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = "Rebuild the image variants of every product and category image, using all cores."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.MEDIA_WORKERS,
+                            help="Worker processes (0 renders in this process).")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Rows read and written at a time.")
+        parser.add_argument("--model", action="append", choices=["product", "category"], dest="models",
+                            help="Only rebuild this model's images (repeatable).")
+        parser.add_argument("--force", action="store_true",
+                            help="Re-encode every image, even those whose variants are up to date.")
+
+    def handle(self, *args, **options):
+        models = {"product": Product, "category": Category}
+        started = time.perf_counter()
+        pool = media_tasks.executor(options["workers"])
+        rendered_total = 0
+        try:
+            for name in options["models"] or models:
+                def progress(done, total, rendered, name=name, since=time.perf_counter()):
+                    rate = rendered / max(time.perf_counter() - since, 1e-9)
+                    self.stdout.write(f"{name}: {done}/{total} ({done * 100 // total}%), {rendered} rendered, {rate:.0f} images/s")
+
+                done, rendered = media_tasks.rebuild(models[name], pool, options["chunk_size"], options["force"], progress)
+                rendered_total += rendered
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Rendered {rendered_total} images in {elapsed:.1f}s."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apiApp import ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute every ProductRating from the reviews table in one grouped query."
+
+    def handle(self, *args, **options):
+        total = ratings.rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {total} products."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apiApp import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from the product and category tables."
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING("This database has no search index; search falls back to icontains."))
+            return
+        total = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} products."))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apiApp.benchmark import seed_catalog
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic catalog (products, users, carts, reviews, orders) for benchmarking."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100_000)
+        parser.add_argument("--categories", type=int, default=50)
+        parser.add_argument("--users", type=int, default=2_000)
+        parser.add_argument("--carts", type=int, default=2_000)
+        parser.add_argument("--reviews", type=int, default=50_000)
+        parser.add_argument("--orders", type=int, default=20_000)
+        parser.add_argument("--batch-size", type=int, default=2_000)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = seed_catalog(**{key: options[key] for key in (
+            "products", "categories", "users", "carts", "reviews", "orders", "batch_size", "seed")})
+        elapsed = time.perf_counter() - started
+        summary = ", ".join(f"{count} {name}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary} in {elapsed:.1f}s."))
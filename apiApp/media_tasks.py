@@ -0,0 +1,180 @@
+import logging
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Category, MediaTask, Product
+from . import cache as catalog_cache
+from . import conditional
+from . import images
+
+
+logger = logging.getLogger(__name__)
+
+
+# Image variants are built off the request path. Saving a Product or
+# Category with a new image queues a MediaTask; the `process_media` worker
+# claims queued tasks (like the webhook queue), renders them in a process
+# pool so every core decodes and encodes in parallel, and records the
+# results. `rebuild_media` pushes every stored image through the same pool.
+
+MODELS = {model._meta.label_lower: model for model in (Product, Category)}
+
+
+def executor(workers):
+    """A process pool for images.render, or None to render in-process (workers=0)."""
+    if not workers:
+        return None
+    return ProcessPoolExecutor(workers, initializer=images.init_worker)
+
+
+def enqueue(model, rows):
+    """Queue variant builds for ``rows`` of (pk, image name); a queued object is re-queued in place."""
+    tasks = [MediaTask(model=model._meta.label_lower, object_id=pk, source=name) for pk, name in rows]
+    if tasks:
+        MediaTask.objects.bulk_create(
+            tasks, batch_size=1000, update_conflicts=True, unique_fields=['model', 'object_id'],
+            update_fields=['source', 'status', 'attempts', 'locked_by', 'locked_at', 'last_error', 'updated_at'],
+        )
+
+
+def enqueue_for(instance):
+    image = instance.image
+    if image and instance.image_variants.get('source') != image.name:
+        enqueue(type(instance), [(instance.pk, image.name)])
+    elif not image and instance.image_variants:
+        instance.image_variants = {}
+        # update() rather than save(), so the model's signals don't fire again.
+        type(instance)._default_manager.filter(pk=instance.pk).update(image_variants={})
+
+
+def claim_tasks(batch_size):
+    now = timezone.now()
+    # Tasks held by a worker that died are released after the timeout.
+    MediaTask.objects.filter(
+        status=MediaTask.PROCESSING,
+        locked_at__lt=now - timedelta(seconds=settings.MEDIA_TASK_VISIBILITY_TIMEOUT),
+    ).update(status=MediaTask.PENDING, locked_by="", locked_at=None)
+
+    due = MediaTask.objects.filter(status=MediaTask.PENDING).order_by('updated_at').values_list('id', flat=True)[:batch_size]
+    token = uuid.uuid4().hex
+    MediaTask.objects.filter(id__in=list(due), status=MediaTask.PENDING).update(
+        status=MediaTask.PROCESSING, locked_by=token, locked_at=now
+    )
+    return list(MediaTask.objects.filter(locked_by=token, status=MediaTask.PROCESSING))
+
+
+def _current_images(tasks):
+    """{(model, pk): (image name, source of the stored variants)} for the tasks' objects."""
+    current = {}
+    for label, model in MODELS.items():
+        ids = [task.object_id for task in tasks if task.model == label]
+        if ids:
+            for pk, image, variants in model._default_manager.filter(pk__in=ids).values_list('pk', 'image', 'image_variants'):
+                current[label, pk] = (image, variants.get('source'))
+    return current
+
+
+def _render(tasks, pool):
+    """Yield (task, variants, error) per task, rendering in ``pool`` if there is one."""
+    if pool is None:
+        for task in tasks:
+            try:
+                yield task, images.render(task.source), None
+            except Exception:
+                yield task, None, traceback.format_exc()
+        return
+    futures = {pool.submit(images.render, task.source): task for task in tasks}
+    for future in as_completed(futures):
+        try:
+            yield futures[future], future.result(), None
+        except Exception:
+            yield futures[future], None, traceback.format_exc()
+
+
+def _fail(task, error):
+    attempts = task.attempts + 1
+    status = MediaTask.FAILED if attempts >= settings.MEDIA_TASK_MAX_ATTEMPTS else MediaTask.PENDING
+    MediaTask.objects.filter(pk=task.pk, locked_by=task.locked_by).update(
+        status=status, attempts=attempts, last_error=error, locked_by="", locked_at=None
+    )
+    logger.warning("Media task for %s %s failed (attempt %s)", task.model, task.object_id, attempts)
+
+
+def invalidate(labels):
+    if Product._meta.label_lower in labels:
+        catalog_cache.invalidate('product', 'category')
+    elif Category._meta.label_lower in labels:
+        catalog_cache.invalidate('category')
+    if labels:
+        conditional.bump()
+
+
+def process_batch(batch_size, pool=None):
+    tasks = claim_tasks(batch_size)
+    if not tasks:
+        return 0
+
+    # Skip objects deleted, given another image or already built since the
+    # task was queued; a newer upload has re-queued the task anyway.
+    current = _current_images(tasks)
+    todo, done = [], []
+    for task in tasks:
+        image, built = current.get((task.model, task.object_id), (None, None))
+        (todo if image == task.source and built != task.source else done).append(task)
+
+    changed = set()
+    for task, variants, error in _render(todo, pool):
+        if error is not None:
+            _fail(task, error)
+            continue
+        # Only if the object still has the image that was rendered.
+        if MODELS[task.model]._default_manager.filter(pk=task.object_id, image=task.source).update(image_variants=variants):
+            changed.add(task.model)
+        done.append(task)
+
+    MediaTask.objects.filter(pk__in=[task.pk for task in done], locked_by=tasks[0].locked_by).update(
+        status=MediaTask.DONE, locked_by="", locked_at=None, last_error=""
+    )
+    invalidate(changed)
+    return len(tasks)
+
+
+def rebuild(model, pool=None, chunk_size=500, force=False, progress=None):
+    """
+    Build the variants of every ``model`` image, ``chunk_size`` rows at a
+    time. Images whose variants are up to date are skipped unless
+    ``force``, which also re-encodes existing variant files. ``progress``
+    is called with (rows done, rows total, images rendered) after each chunk.
+    """
+    rows = (
+        model._default_manager.exclude(image='').exclude(image__isnull=True)
+        .order_by('pk').values_list('pk', 'image', 'image_variants')
+    )
+    total = rows.count()
+    render = partial(images.render, overwrite=force)
+    done = rendered = 0
+
+    iterator = rows.iterator(chunk_size=chunk_size)
+    while chunk := list(islice(iterator, chunk_size)):
+        todo = [(pk, name) for pk, name, variants in chunk if force or variants.get('source') != name]
+        names = [name for pk, name in todo]
+        results = pool.map(render, names, chunksize=8) if pool else map(render, names)
+        model._default_manager.bulk_update(
+            [model(pk=pk, image_variants=variants) for (pk, name), variants in zip(todo, results)],
+            ['image_variants'], batch_size=chunk_size,
+        )
+        done += len(chunk)
+        rendered += len(todo)
+        if progress:
+            progress(done, total, rendered)
+
+    if rendered:
+        invalidate({model._meta.label_lower})
+    return done, rendered
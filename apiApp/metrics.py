@@ -0,0 +1,130 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+
+
+# In-process, per-view request metrics for the instrumentation middleware.
+# Each worker process keeps its own rolling window, split into slices so
+# old observations age out; scrape every worker (or sum them) to see the
+# whole deployment.
+
+SERIES = {
+    'request_duration_seconds': ('Wall time spent handling the request.',
+                                 (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    'db_queries': ('Database queries run by the request.',
+                   (0, 1, 2, 3, 5, 10, 20, 50, 100)),
+    'db_duration_seconds': ('Time spent in the database.',
+                            (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)),
+    'serializer_duration_seconds': ('Time spent rendering serializer data (including queries it triggers).',
+                                    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)),
+    'response_size_bytes': ('Response body size.',
+                            (256, 1024, 4096, 16384, 65536, 262144, 1048576)),
+}
+
+PREFIX = 'apiapp_'
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.sum += other.sum
+        self.count += other.count
+
+
+class RollingRegistry:
+    """
+    Histograms per (series, view) over the last ``window`` seconds, kept as
+    ``slices`` rotating sub-windows.
+    """
+
+    def __init__(self, window, slices):
+        self.slice_seconds = window / slices
+        self.slices = slices
+        self._lock = threading.Lock()
+        self._ring = {}
+
+    def _current(self, now):
+        index = int(now // self.slice_seconds)
+        data = self._ring.get(index)
+        if data is None:
+            data = self._ring[index] = {}
+            for stale in [key for key in self._ring if key <= index - self.slices]:
+                del self._ring[stale]
+        return data
+
+    def record(self, view, observations, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            data = self._current(now)
+            for name, value in observations.items():
+                key = (name, view)
+                histogram = data.get(key)
+                if histogram is None:
+                    histogram = data[key] = Histogram(SERIES[name][1])
+                histogram.observe(value)
+
+    def snapshot(self, now=None):
+        now = time.time() if now is None else now
+        oldest = int(now // self.slice_seconds) - self.slices + 1
+        merged = {}
+        with self._lock:
+            for index, data in self._ring.items():
+                if index < oldest:
+                    continue
+                for key, histogram in data.items():
+                    if key not in merged:
+                        merged[key] = Histogram(histogram.buckets)
+                    merged[key].merge(histogram)
+        return merged
+
+    def clear(self):
+        with self._lock:
+            self._ring.clear()
+
+
+registry = RollingRegistry(settings.PERF_METRICS_WINDOW_SECONDS, settings.PERF_METRICS_WINDOW_SLICES)
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(snapshot=None):
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    lines = []
+    for name, (help_text, buckets) in SERIES.items():
+        metric = PREFIX + name
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} histogram')
+        for (series, view), histogram in sorted(snapshot.items()):
+            if series != name:
+                continue
+            view = _label(view)
+            cumulative = 0
+            for bound, count in zip(buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{view="{view}",le="{_number(bound)}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{view="{view}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{metric}_sum{{view="{view}"}} {_number(histogram.sum)}')
+            lines.append(f'{metric}_count{{view="{view}"}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
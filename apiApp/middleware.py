@@ -0,0 +1,140 @@
+import contextvars
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.serializers import BaseSerializer
+
+from .metrics import registry
+
+
+# Per-request performance instrumentation: wall time, DB queries and DB
+# time, serializer time and response size, reported per view name in a
+# Server-Timing header and in the rolling histograms served at metrics/.
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_time', 'serializer_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+
+
+def install_query_wrapper(sender=None, connection=None, **kwargs):
+    # Installed for the lifetime of each connection (not per request) so
+    # queries run from sync_to_async threads are counted as well; the
+    # context variable decides which request they belong to.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+_serializer_data = BaseSerializer.data
+_instrumented = False
+
+
+def _timed_serializer_data(self):
+    metrics = _current.get()
+    if metrics is None or hasattr(self, '_data'):
+        return _serializer_data.fget(self)
+    started = time.perf_counter()
+    try:
+        return _serializer_data.fget(self)
+    finally:
+        metrics.serializer_time += time.perf_counter() - started
+
+
+def instrument():
+    global _instrumented
+    if _instrumented:
+        return
+    _instrumented = True
+    connection_created.connect(install_query_wrapper, dispatch_uid='apiApp.install_query_wrapper')
+    for connection in connections.all(initialized_only=True):
+        install_query_wrapper(connection=connection)
+    # Serializer.data and ListSerializer.data both go through BaseSerializer.data,
+    # and nested serializers call to_representation directly, so only the
+    # top-level serializer of a response is timed.
+    BaseSerializer.data = property(_timed_serializer_data)
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.PERF_METRICS_ENABLED
+        if self.enabled:
+            instrument()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+
+    def finish(self, request, response, metrics, duration):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            # Static files and unrouted 404s would only add unbounded labels.
+            return response
+
+        observations = {
+            'request_duration_seconds': duration,
+            'db_queries': metrics.queries,
+            'db_duration_seconds': metrics.db_time,
+            'serializer_duration_seconds': metrics.serializer_time,
+        }
+        timing = [
+            f'total;dur={duration * 1000:.2f}',
+            f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"',
+            f'serializer;dur={metrics.serializer_time * 1000:.2f}',
+        ]
+        if not response.streaming:
+            size = len(response.content)
+            observations['response_size_bytes'] = size
+            timing.append(f'size;desc="{size} bytes"')
+
+        registry.record(match.view_name or match._func_path, observations)
+        response.headers['Server-Timing'] = ', '.join(timing)
+        return response
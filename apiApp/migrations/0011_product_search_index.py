@@ -0,0 +1,67 @@
+from django.db import migrations
+
+
+# The search index lives outside the ORM: an FTS5 virtual table on SQLite
+# and a tsvector table with a GIN index on Postgres. Both are keyed by the
+# product id and kept in sync by apiApp.search.
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE "apiApp_productsearch" USING fts5(
+        name, description, category,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    INSERT INTO "apiApp_productsearch" (rowid, name, description, category)
+    SELECT p.id, p.name, p.description, COALESCE(c.name, '')
+    FROM "apiApp_product" p LEFT JOIN "apiApp_category" c ON c.id = p.category_id
+    """,
+]
+
+POSTGRES_FORWARD = [
+    """
+    CREATE TABLE "apiApp_productsearch" (
+        product_id bigint PRIMARY KEY REFERENCES "apiApp_product" (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX "apiApp_productsearch_document_gin" ON "apiApp_productsearch" USING gin (document)
+    """,
+    """
+    INSERT INTO "apiApp_productsearch" (product_id, document)
+    SELECT p.id,
+        setweight(to_tsvector('english', coalesce(p.name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(c.name, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(p.description, '')), 'C')
+    FROM "apiApp_product" p LEFT JOIN "apiApp_category" c ON c.id = p.category_id
+    """,
+]
+
+BACKWARD = ['DROP TABLE IF EXISTS "apiApp_productsearch"']
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        for statement in BACKWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0010_order_orderitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:18
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_rating_sum(apps, schema_editor):
+    Reviews = apps.get_model('apiApp', 'Reviews')
+    ProductRating = apps.get_model('apiApp', 'ProductRating')
+    sums = dict(Reviews.objects.values('product').annotate(total=Sum('rating')).values_list('product', 'total'))
+    ratings = list(ProductRating.objects.filter(product_id__in=sums))
+    for rating in ratings:
+        rating.rating_sum = sums[rating.product_id]
+    ProductRating.objects.bulk_update(ratings, ['rating_sum'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0011_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productrating',
+            name='rating_sum',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_sum, migrations.RunPython.noop),
+    ]
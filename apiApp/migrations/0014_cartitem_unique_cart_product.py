@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:22
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cartitems(apps, schema_editor):
+    # Lost-update races could leave several lines for one product in a
+    # cart; fold them into the oldest line before the constraint goes on.
+    CartItem = apps.get_model('apiApp', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart', 'product')
+        .annotate(lines=Count('id'), keep=Min('id'), total=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for row in duplicates:
+        CartItem.objects.filter(id=row['keep']).update(quantity=row['total'])
+        CartItem.objects.filter(cart=row['cart'], product=row['product']).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0013_webhookevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cartitems, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product'),
+        ),
+    ]
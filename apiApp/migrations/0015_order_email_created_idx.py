@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0014_cartitem_unique_cart_product'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer_email', '-created_at', '-id'], name='order_email_created_idx'),
+        ),
+    ]
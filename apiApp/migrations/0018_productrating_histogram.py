@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:54
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_histogram(apps, schema_editor):
+    Reviews = apps.get_model('apiApp', 'Reviews')
+    ProductRating = apps.get_model('apiApp', 'ProductRating')
+    fields = [f'rating_{star}' for star in range(1, 6)]
+    counts = {
+        row.pop('product'): row
+        for row in Reviews.objects.values('product').annotate(
+            **{f'rating_{star}': Count('id', filter=Q(rating=star)) for star in range(1, 6)}
+        ).order_by()
+    }
+    ratings = list(ProductRating.objects.filter(product_id__in=counts))
+    for rating in ratings:
+        for field in fields:
+            setattr(rating, field, counts[rating.product_id][field])
+    ProductRating.objects.bulk_update(ratings, fields, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0017_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productrating',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_histogram, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apiApp', '0018_productrating_histogram'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='wishlist',
+            index=models.Index(fields=['user', '-created', '-id'], name='wishlist_user_created_idx'),
+        ),
+    ]
@@ -1,8 +1,14 @@
+from decimal import Decimal
+
 from django.conf import settings
 from django.db import models
-from django.utils.text import slugify
+from django.db.models import DecimalField, F, IntegerField, Prefetch, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
+from .slugs import save_with_slug
+
 
 
 class CustomUser(AbstractUser):
@@ -18,20 +24,15 @@ class Category(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True, blank=True)
     image = models.ImageField(upload_to='category_img', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.name
     
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug =  slugify(self.name)
-            unique_slug = self.slug
-            counter = 1
-            if Product.objects.filter(slug=unique_slug).exists():
-                unique_slug = f"{self.slug}-{counter}"
-                counter +=1
-            self.slug = unique_slug
-        super().save(*args, **kwargs)
+        if self.slug:
+            return super().save(*args, **kwargs)
+        save_with_slug(self, lambda: super(Category, self).save(*args, **kwargs), self.name)
     
     
 
@@ -40,31 +41,56 @@ class Product(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to='product_img', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     slug = models.SlugField(unique=True, blank=True)
     featured = models.BooleanField(default=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, related_name='products', blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # product_list only pages through featured products, by id or by price.
+            models.Index(fields=['id'], condition=models.Q(featured=True), name='product_featured_idx'),
+            models.Index(fields=['price', 'id'], condition=models.Q(featured=True), name='product_featured_price_idx'),
+        ]
+
     def __str__(self):
         return self.name
     
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug =  slugify(self.name)
-            unique_slug = self.slug
-            counter = 1
-            if Product.objects.filter(slug=unique_slug).exists():
-                unique_slug = f"{self.slug}-{counter}"
-                counter +=1
-            self.slug = unique_slug
-        super().save(*args, **kwargs)
+        if self.slug:
+            return super().save(*args, **kwargs)
+        save_with_slug(self, lambda: super(Product, self).save(*args, **kwargs), self.name)
     
 
 
+class CartQuerySet(models.QuerySet):
+    def with_items(self):
+        # One query for the cart plus its totals (aggregated in SQL) and one
+        # for the items joined to their products, however many lines it has.
+        return self.annotate(
+            cart_total=Coalesce(
+                Sum(F('cartitems__quantity') * F('cartitems__product__price'),
+                    output_field=DecimalField(max_digits=12, decimal_places=2)),
+                Value(Decimal('0.00')),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            total_quantity=Coalesce(Sum('cartitems__quantity'), Value(0), output_field=IntegerField()),
+        ).prefetch_related(
+            Prefetch('cartitems', queryset=CartItem.objects.select_related('product').order_by('id'))
+        )
+
+
+
 class Cart(models.Model):
     cart_code = models.CharField(max_length=12, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['updated_at'], name='cart_updated_idx')]
+
 
     def __str__(self):
         return self.cart_code
@@ -76,6 +102,11 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='item')
     quantity = models.IntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in cart {self.cart.id}"
@@ -105,12 +136,20 @@ class Reviews(models.Model):
     class Meta:
         unique_together = ["user", "product"]
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx')]
 
 
 class ProductRating(models.Model):
     product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='rating')
     average_rating = models.FloatField(default=0.0)
     total_reviews = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveBigIntegerField(default=0)
+    # Star histogram, kept in step with total_reviews by apiApp.ratings.
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.product.name} - {self.average_rating} ({self.total_reviews} reviews)"
@@ -123,6 +162,7 @@ class Wishlist(models.Model):
 
     class Meta:
         unique_together = ["user", "product"]
+        indexes = [models.Index(fields=['user', '-created', '-id'], name='wishlist_user_created_idx')]
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
@@ -137,6 +177,12 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=[("Pending", "Pending"), ("Paid", "Paid")])
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer_email', '-created_at', '-id'], name='order_email_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.stripe_checkout_id} - {self.status}"
     
@@ -147,4 +193,71 @@ class OrderItem(models.Model):
     quantity = models.IntegerField(default=1)
 
     def __str__(self):
-        return f"Order {self.product.name} - {self.order.stripe_checkout_id}"
\ No newline at end of file
+        return f"Order {self.product.name} - {self.order.stripe_checkout_id}"
+
+
+
+class WebhookEvent(models.Model):
+    PENDING = "Pending"
+    PROCESSING = "Processing"
+    DONE = "Done"
+    DEAD = "Dead"
+    STATUS_CHOICES = [(PENDING, "Pending"), (PROCESSING, "Processing"), (DONE, "Done"), (DEAD, "Dead")]
+
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='webhook_due_idx')]
+
+    def __str__(self):
+        return f"{self.event_type} {self.event_id} - {self.status}"
+
+
+
+class MediaTask(models.Model):
+    # Queue of images waiting for their variants (apiApp.media_tasks), one
+    # row per Product/Category; a new upload re-queues the same row.
+    PENDING = "Pending"
+    PROCESSING = "Processing"
+    DONE = "Done"
+    FAILED = "Failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (PROCESSING, "Processing"), (DONE, "Done"), (FAILED, "Failed")]
+
+    model = models.CharField(max_length=100)
+    object_id = models.PositiveBigIntegerField()
+    source = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['model', 'object_id'], name='mediatask_unique_object')]
+        indexes = [models.Index(fields=['status', 'updated_at'], name='mediatask_due_idx')]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} - {self.status}"
+
+
+
+class CatalogVersion(models.Model):
+    # Single row (pk=1) bumped on every Product/Category change; the
+    # catalog endpoints derive their ETag and Last-Modified from it.
+    version = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Catalog v{self.version}"
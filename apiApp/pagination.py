@@ -0,0 +1,163 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination, _reverse_ordering
+
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    CursorPagination keyed on every column of the ordering, which must end
+    in a unique one. DRF's cursor holds only the first column and pages
+    through rows that tie on it with OFFSET; here the cursor holds the
+    whole key of the boundary row and the next page starts at
+    `(a, b) > (x, y)`, spelled `a >= x AND (a > x OR (a = x AND b > y))`,
+    so no page needs an OFFSET however many rows share a price.
+    """
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            name = order.lstrip('-')
+            values.append(str(instance[name] if isinstance(instance, dict) else getattr(instance, name)))
+        return json.dumps(values)
+
+    def _position_values(self, position, model):
+        """The cursor's key, converted by each ordering field; a forged cursor is a 404."""
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(self.ordering) or None in values:
+                raise ValueError
+            return [
+                model._meta.get_field(order.lstrip('-')).to_python(value)
+                for order, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def keyset_filter(self, position, reverse, model):
+        names = [order.lstrip('-') for order in self.ordering]
+        values = self._position_values(position, model)
+        query = Q()
+        for i, order in enumerate(self.ordering):
+            # Test for: (cursor reversed) XOR (column reversed)
+            lookup = 'lt' if reverse != order.startswith('-') else 'gt'
+            ties = dict(zip(names[:i], values[:i]))
+            query |= Q(**ties, **{f'{names[i]}__{lookup}': values[i]})
+        # The redundant bound on the leading column gives the index scan a
+        # starting point instead of a filter over every earlier row.
+        lookup = 'lte' if reverse != self.ordering[0].startswith('-') else 'gte'
+        return Q(**{f'{names[0]}__{lookup}': values[0]}) & query
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # As CursorPagination.paginate_queryset, with the position filter
+        # over the whole ordering. As positions are unique, offset stays 0.
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self.keyset_filter(current_position, reverse, queryset.model))
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+
+
+class ProductCursorPagination(KeysetCursorPagination):
+    # Keyset pagination: each page is a `WHERE id > <cursor> ... LIMIT n`
+    # range scan (or `(price, id) > (...)` with ?ordering=price), so cost
+    # stays flat no matter how deep the client pages.
+    page_size = settings.PRODUCT_LIST_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.PRODUCT_LIST_MAX_PAGE_SIZE
+    ordering = ('id',)
+    ordering_query_param = 'ordering'
+    orderings = {
+        'id': ('id',),
+        'price': ('price', 'id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        key = request.query_params.get(self.ordering_query_param)
+        return self.orderings.get(key, self.ordering)
+
+
+
+class SearchPagination(PageNumberPagination):
+    # Search results are ordered by relevance, which has no stable keyset,
+    # so they are paged by number instead.
+    page_size = settings.SEARCH_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.SEARCH_MAX_PAGE_SIZE
+
+
+
+class OrderCursorPagination(CursorPagination):
+    page_size = settings.ORDER_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.ORDER_MAX_PAGE_SIZE
+    ordering = ('-created_at', '-id')
+
+
+
+class ReviewCursorPagination(CursorPagination):
+    # Served by review_product_created_idx (product, -created_at, -id).
+    page_size = settings.REVIEW_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.REVIEW_MAX_PAGE_SIZE
+    ordering = ('-created_at', '-id')
+
+
+
+class WishlistCursorPagination(CursorPagination):
+    page_size = settings.WISHLIST_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.WISHLIST_MAX_PAGE_SIZE
+    ordering = ('-created', '-id')
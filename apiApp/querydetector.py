@@ -0,0 +1,156 @@
+import logging
+import re
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+# Development/staging aid that groups the SQL run inside a block (or a
+# request) by statement shape, to spot N+1 loops and slow queries along
+# with the application code that issued them.
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAMS = r'\(\s*\?(?:\s*,\s*\?)*\s*\)'
+_IN_LIST_RE = re.compile(rf'\bIN\s*{_PARAMS}', re.IGNORECASE)
+_VALUES_RE = re.compile(rf'\bVALUES\s*{_PARAMS}(?:\s*,\s*{_PARAMS})*', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+SKIPPED_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+def normalize(sql):
+    """Reduce a statement to its shape: literals and parameter lists become ?."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _VALUES_RE.sub('VALUES (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def _app_stack():
+    # Only frames from this project; Django/DRF internals are noise here.
+    root = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(root) and 'site-packages' not in frame.filename
+        and not frame.filename.endswith('querydetector.py')
+    ]
+    return ''.join(traceback.format_list(frames))
+
+
+class QueryGroup:
+    __slots__ = ('shape', 'count', 'duration', 'stack')
+
+    def __init__(self, shape, stack):
+        self.shape = shape
+        self.stack = stack
+        self.count = 0
+        self.duration = 0.0
+
+
+class QueryDetector:
+    def __init__(self, threshold=None, slow_ms=None, using=None):
+        self.threshold = threshold or settings.QUERY_DETECTOR_N_PLUS_ONE_THRESHOLD
+        self.slow_ms = slow_ms if slow_ms is not None else settings.QUERY_DETECTOR_SLOW_QUERY_MS
+        self.using = using
+        self.groups = {}
+        self.slow = []
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, (time.perf_counter() - started) * 1000)
+
+    def record(self, sql, duration_ms):
+        if sql.startswith(SKIPPED_STATEMENTS):
+            return
+        shape = normalize(sql)
+        group = self.groups.get(shape)
+        if group is None:
+            # The first occurrence is enough to locate the loop.
+            group = self.groups[shape] = QueryGroup(shape, _app_stack())
+        group.count += 1
+        group.duration += duration_ms
+        if duration_ms >= self.slow_ms:
+            self.slow.append((sql, duration_ms, group.stack if group.count == 1 else _app_stack()))
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        aliases = [self.using] if self.using else list(connections)
+        for alias in aliases:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def query_count(self):
+        return sum(group.count for group in self.groups.values())
+
+    def repeated(self):
+        return sorted(
+            (group for group in self.groups.values() if group.count >= self.threshold),
+            key=lambda group: -group.count,
+        )
+
+    def report(self):
+        lines = []
+        for group in self.repeated():
+            lines.append(f'N+1: {group.count} queries ({group.duration:.1f}ms) of shape:\n    {group.shape}\n'
+                         f'  first issued from:\n{group.stack}')
+        for sql, duration_ms, stack in self.slow:
+            lines.append(f'Slow query ({duration_ms:.1f}ms):\n    {sql}\n  issued from:\n{stack}')
+        return '\n'.join(lines)
+
+
+@contextmanager
+def assert_no_n_plus_one(threshold=None, slow_ms=None, using=None):
+    """
+    Test helper: fail when any statement shape runs ``threshold`` or more
+    times inside the block (or a query is slower than ``slow_ms``).
+
+        with assert_no_n_plus_one():
+            self.client.get('/api/orders/')
+    """
+    with QueryDetector(threshold, slow_ms if slow_ms is not None else float('inf'), using) as detector:
+        yield detector
+    if detector.repeated() or detector.slow:
+        raise NPlusOneError(detector.report())
+
+
+class QueryDetectorMiddleware:
+    """
+    Logging mode: warns on ``apiApp.querydetector`` for every request that
+    repeats a statement shape or runs a slow query. Enable it with
+    QUERY_DETECTOR_ENABLED; it removes itself from the stack otherwise.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_DETECTOR_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryDetector() as detector:
+            response = self.get_response(request)
+        if detector.repeated() or detector.slow:
+            logger.warning('%s %s ran %s queries\n%s', request.method, request.path,
+                           detector.query_count, detector.report())
+        return response
@@ -0,0 +1,86 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
+
+from .models import ProductRating, Reviews
+
+
+# ProductRating keeps a running count, sum and star histogram of ratings so
+# a review write is a single UPDATE of one row instead of re-aggregating
+# every review of the product. The average is derived in the same statement.
+
+STARS = (1, 2, 3, 4, 5)
+HISTOGRAM_FIELDS = [f'rating_{star}' for star in STARS]
+
+
+def apply_rating_change(product_id, old=None, new=None):
+    """
+    Account for one review whose rating went from ``old`` to ``new``
+    (``old`` is None for a new review, ``new`` is None for a deleted one).
+    """
+    count_delta = (new is not None) - (old is not None)
+    sum_delta = (new or 0) - (old or 0)
+    stars = {}
+    if old is not None:
+        stars[old] = -1
+    if new is not None:
+        stars[new] = stars.get(new, 0) + 1
+
+    new_total = F('total_reviews') + count_delta
+    new_sum = F('rating_sum') + sum_delta
+    updated = ProductRating.objects.filter(product_id=product_id).update(
+        **{f'rating_{star}': F(f'rating_{star}') + delta for star, delta in stars.items() if delta and star in STARS},
+        total_reviews=new_total,
+        rating_sum=new_sum,
+        # Right-hand sides see the row's old values, so recompute from them.
+        average_rating=Case(
+            When(total_reviews__lte=-count_delta, then=Value(0.0)),
+            default=Cast(new_sum, FloatField()) / new_total,
+            output_field=FloatField(),
+        ),
+    )
+    if updated or count_delta <= 0:
+        return
+
+    try:
+        with transaction.atomic():
+            ProductRating.objects.create(
+                product_id=product_id,
+                total_reviews=1,
+                rating_sum=new,
+                average_rating=float(new),
+                **({f'rating_{new}': 1} if new in STARS else {}),
+            )
+    except IntegrityError:
+        # Another review created the row first; fold ours into it.
+        apply_rating_change(product_id, old, new)
+
+
+def rebuild_ratings():
+    rows = Reviews.objects.values('product').annotate(
+        total=Count('id'),
+        rating_sum=Sum('rating'),
+        **{field: Count('id', filter=Q(rating=star)) for star, field in zip(STARS, HISTOGRAM_FIELDS)},
+    ).order_by()
+    ratings = [
+        ProductRating(
+            product_id=row['product'],
+            total_reviews=row['total'],
+            rating_sum=row['rating_sum'],
+            average_rating=row['rating_sum'] / row['total'],
+            **{field: row[field] for field in HISTOGRAM_FIELDS},
+        )
+        for row in rows
+    ]
+    with transaction.atomic():
+        ProductRating.objects.update(
+            total_reviews=0, rating_sum=0, average_rating=0.0, **{field: 0 for field in HISTOGRAM_FIELDS},
+        )
+        ProductRating.objects.bulk_create(
+            ratings,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['total_reviews', 'rating_sum', 'average_rating', *HISTOGRAM_FIELDS],
+        )
+    return len(ratings)
@@ -0,0 +1,61 @@
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Cart, CartItem
+
+
+# Expired-cart reaper (manage.py purge_carts). Carts whose updated_at is
+# older than CART_RETENTION_DAYS are deleted oldest first, in batches of
+# CART_PURGE_BATCH_SIZE picked through cart_updated_idx. Each batch is its
+# own short transaction, with a pause in between, so live cart writes and
+# checkouts never wait on more than one batch.
+
+PurgeResult = namedtuple('PurgeResult', ['carts', 'items', 'batches', 'seconds'])
+
+
+def cutoff(days=None):
+    days = settings.CART_RETENTION_DAYS if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+
+def purge_batch(before, batch_size):
+    """Delete up to ``batch_size`` carts idle since ``before``; returns (carts, items)."""
+    with transaction.atomic():
+        # On Postgres, carts being written right now are locked by that
+        # write and skipped rather than waited on (no-op on SQLite).
+        ids = list(
+            Cart.objects.select_for_update(skip_locked=True)
+            .filter(updated_at__lt=before)
+            .order_by('updated_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0, 0
+        _, counts = Cart.objects.filter(id__in=ids, updated_at__lt=before).delete()
+    return counts.get(Cart._meta.label, 0), counts.get(CartItem._meta.label, 0)
+
+
+def purge_carts(days=None, batch_size=None, pause=None, max_batches=None):
+    before = cutoff(days)
+    batch_size = batch_size or settings.CART_PURGE_BATCH_SIZE
+    pause = settings.CART_PURGE_PAUSE if pause is None else pause
+    started = time.perf_counter()
+
+    carts = items = batches = 0
+    while max_batches is None or batches < max_batches:
+        deleted, deleted_items = purge_batch(before, batch_size)
+        if not deleted:
+            break
+        carts += deleted
+        items += deleted_items
+        batches += 1
+        if deleted < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return PurgeResult(carts, items, batches, time.perf_counter() - started)
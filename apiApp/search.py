@@ -0,0 +1,162 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+from .serializers import ProductListSerializer
+
+
+# Full-text product search. The index table is created by migration 0011:
+# an FTS5 virtual table on SQLite (dev) and a tsvector table with a GIN
+# index on Postgres (PROD_DB). Any other backend falls back to icontains.
+
+TABLE = '"apiApp_productsearch"'
+MAX_TERMS = 8
+CHUNK_SIZE = 500
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+POSTGRES_DOCUMENT = """
+    setweight(to_tsvector('english', coalesce(p.name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(c.name, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(p.description, '')), 'C')
+"""
+
+
+def is_supported():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:MAX_TERMS]
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def index_products(product_ids):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(product_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})', chunk)
+                cursor.execute(
+                    f'INSERT INTO {TABLE} (rowid, name, description, category) '
+                    f'SELECT p.id, p.name, p.description, COALESCE(c.name, \'\') '
+                    f'FROM "apiApp_product" p LEFT JOIN "apiApp_category" c ON c.id = p.category_id '
+                    f'WHERE p.id IN ({placeholders})',
+                    chunk,
+                )
+            else:
+                cursor.execute(
+                    f'INSERT INTO {TABLE} (product_id, document) '
+                    f'SELECT p.id, {POSTGRES_DOCUMENT} '
+                    f'FROM "apiApp_product" p LEFT JOIN "apiApp_category" c ON c.id = p.category_id '
+                    f'WHERE p.id IN ({placeholders}) '
+                    f'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document',
+                    chunk,
+                )
+
+
+def remove_products(product_ids):
+    if not is_supported():
+        return
+    key = 'rowid' if connection.vendor == 'sqlite' else 'product_id'
+    with connection.cursor() as cursor:
+        for chunk in _chunks(product_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {TABLE} WHERE {key} IN ({placeholders})', chunk)
+
+
+def rebuild_index():
+    if not is_supported():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    product_ids = list(Product.objects.values_list('id', flat=True))
+    index_products(product_ids)
+    return len(product_ids)
+
+
+
+class SearchResults:
+    """
+    Ranked search results, evaluated lazily so Django's Paginator only
+    fetches the requested page (and one COUNT) from the index.
+    """
+
+    def __init__(self, query, rows=None):
+        self.terms = tokenize(query)
+        # With a fastpath.RowSerializer the page is fetched as .values() rows.
+        self.rows = rows
+        self._count = None
+
+    def _match(self):
+        if connection.vendor == 'sqlite':
+            # Every term must match; the trailing * makes it a prefix match.
+            return ' '.join(f'"{term}"*' for term in self.terms)
+        return ' & '.join(f'{term}:*' for term in self.terms)
+
+    def _fallback(self):
+        query = Q()
+        for term in self.terms:
+            query &= Q(name__icontains=term) | Q(description__icontains=term) | Q(category__name__icontains=term)
+        return Product.objects.filter(query).order_by('id')
+
+    def count(self):
+        if self._count is None:
+            if not self.terms:
+                self._count = 0
+            elif not is_supported():
+                self._count = self._fallback().count()
+            else:
+                with connection.cursor() as cursor:
+                    if connection.vendor == 'sqlite':
+                        cursor.execute(f'SELECT count(*) FROM {TABLE} WHERE {TABLE} MATCH %s', [self._match()])
+                    else:
+                        cursor.execute(
+                            f"SELECT count(*) FROM {TABLE} WHERE document @@ to_tsquery('english', %s)",
+                            [self._match()],
+                        )
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError('SearchResults only supports slicing.')
+        offset = index.start or 0
+        limit = (index.stop if index.stop is not None else self.count()) - offset
+        if not self.terms or limit <= 0:
+            return []
+        if not is_supported():
+            products = self.rows.values(self._fallback()) if self.rows else self._fallback()
+            return list(products[offset:offset + limit])
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(
+                    f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s '
+                    f'ORDER BY bm25({TABLE}, 10.0, 1.0, 5.0), rowid LIMIT %s OFFSET %s',
+                    [self._match(), limit, offset],
+                )
+            else:
+                cursor.execute(
+                    f"SELECT product_id FROM {TABLE}, to_tsquery('english', %s) query "
+                    f'WHERE document @@ query ORDER BY ts_rank(document, query) DESC, product_id LIMIT %s OFFSET %s',
+                    [self._match(), limit, offset],
+                )
+            ids = [row[0] for row in cursor.fetchall()]
+
+        if self.rows:
+            products = {row['id']: row for row in self.rows.values(Product.objects.filter(id__in=ids))}
+        else:
+            products = Product.objects.only(*ProductListSerializer.Meta.fields).in_bulk(ids)
+        return [products[pk] for pk in ids if pk in products]
@@ -1,19 +1,48 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Cart, CartItem, Order, OrderItem, Product, Category, Reviews, Wishlist
+from django.core.files.storage import default_storage
+from .models import Cart, CartItem, Order, OrderItem, Product, ProductRating, Category, Reviews, Wishlist
 
 
 
+def variant_urls(variants, image):
+    """
+    {"webp": {"200": url, ...}, "jpeg": {...}} from a model's image_variants,
+    or {} if they weren't built from its current ``image`` (a new upload
+    still waiting for the media worker, or an image that was removed).
+    """
+    if not image or variants.get('source') != image:
+        return {}
+    return {
+        fmt: {width: default_storage.url(name) for width, name in names.items()}
+        for fmt, names in variants.items() if fmt != 'source'
+    }
+
+
+class ImageVariantsField(serializers.Field):
+    """The object's image_variants, checked against its image (see variant_urls)."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs.setdefault('read_only', True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return variant_urls(instance.image_variants, instance.image.name)
+
+
 class ProductDetailSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'image', 'slug']
+        fields = ['id', 'name', 'description', 'price', 'image', 'image_variants', 'slug']
 
 
 class ProductListSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
     class Meta:
         model = Product
-        fields = ['id', 'name', 'price', 'image', 'slug']
+        fields = ['id', 'name', 'price', 'image', 'image_variants', 'slug']
 
 
 
@@ -53,19 +82,23 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'cart_code', 'cartitems', 'cart_total']
 
     def get_cart_total(self, cart):
-        items = cart.cartitems.all()
+        if hasattr(cart, 'cart_total'):
+            return cart.cart_total
+        items = cart.cartitems.select_related('product')
         total = sum([item.quantity * item.product.price for item in items])
         return total
     
 
 
-class CartStatSerializer(serializers.Serializer):
+class CartStatSerializer(serializers.ModelSerializer):
     total_quantity = serializers.SerializerMethodField()
     class Meta:
         model = Cart
         fields = ['id', 'cart_code', 'total_quantity']
 
     def get_total_quantity(self, cart):
+        if hasattr(cart, 'total_quantity'):
+            return cart.total_quantity
         items = cart.cartitems.all()
         total = sum([item.quantity for item in items])
         return total
@@ -86,6 +119,23 @@ class ReviewSerializer(serializers.ModelSerializer):
 
 
 
+class ProductRatingSerializer(serializers.ModelSerializer):
+    histogram = serializers.SerializerMethodField()
+    class Meta:
+        model = ProductRating
+        fields = ['average_rating', 'total_reviews', 'histogram']
+
+    def get_histogram(self, rating):
+        return {str(star): getattr(rating, f'rating_{star}') for star in range(1, 6)}
+
+
+
+class ReviewExportSerializer(ReviewSerializer):
+    class Meta(ReviewSerializer.Meta):
+        fields = ['id', 'product', 'user', 'rating', 'comment', 'created_at', 'updated_at']
+
+
+
 class WishlistSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     product = ProductListSerializer(read_only=True)
@@ -95,13 +145,26 @@ class WishlistSerializer(serializers.ModelSerializer):
 
 
 
+class WishlistItemSerializer(serializers.ModelSerializer):
+    product = ProductListSerializer(read_only=True)
+    class Meta:
+        model = Wishlist
+        fields = ["id", "product", "created"]
+
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ['product', 'quantity']
 
+class OrderItemExportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'order', 'product', 'quantity']
+
 class OrderSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(source='orderitem_set', many=True, read_only=True)
+    items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
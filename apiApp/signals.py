@@ -1,34 +1,92 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import Reviews, ProductRating
-from django.db.models import Avg, Count
+from .models import Category, Product, Reviews
+from . import cache as catalog_cache
+from . import conditional
+from . import media_tasks
+from . import ratings
+from . import search
 
 
 
 
-@receiver(post_save, sender=Reviews)
-def update_product_rating_on_save(sender, instance, **kwargs):
-    product = instance.product
-    reviews = product.reviews.all()
-    total_reviews = reviews.count()
+@receiver(post_init, sender=Reviews)
+def remember_saved_rating(sender, instance, **kwargs):
+    # Read from __dict__ so deferred loads don't trigger a refresh query.
+    instance._saved_rating = instance.__dict__.get('rating')
+
 
-    review_average = reviews.aggregate(Avg('rating'))['rating__avg'] or 0.0
-    product_rating, created = ProductRating.objects.get_or_create(product=product)
-    product_rating.average_rating = review_average
-    product_rating.total_reviews = total_reviews
-    product_rating.save()
+
+@receiver(post_save, sender=Reviews)
+def update_product_rating_on_save(sender, instance, created, **kwargs):
+    rating = int(instance.rating)
+    if created:
+        ratings.apply_rating_change(instance.product_id, new=rating)
+    elif instance._saved_rating is not None and rating != int(instance._saved_rating):
+        ratings.apply_rating_change(instance.product_id, old=int(instance._saved_rating), new=rating)
+    instance._saved_rating = rating
 
 
 
 @receiver(post_delete, sender=Reviews)
 def update_product_rating_on_delete(sender, instance, **kwargs):
-    product = instance.product
-    reviews = product.reviews.all()
-    total_reviews = reviews.count()
+    rating = instance._saved_rating if instance._saved_rating is not None else instance.rating
+    ratings.apply_rating_change(instance.product_id, old=int(rating))
+
+
+
+# Variants are rendered by the process_media worker. Connected before the
+# cache receivers below, so cleared variants are stored by the time the
+# cached representations are dropped.
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def queue_image_variants(sender, instance, **kwargs):
+    media_tasks.enqueue_for(instance)
+
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    # Category detail embeds its product list, so it goes stale too.
+    catalog_cache.invalidate('product', 'category')
+    conditional.bump()
+
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    catalog_cache.invalidate('category')
+    conditional.bump()
+
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    search.index_products([instance.pk])
+
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, **kwargs):
+    if not created:
+        search.index_products(instance.products.values_list('id', flat=True))
+
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_products(sender, instance, **kwargs):
+    instance._product_ids = list(instance.products.values_list('id', flat=True))
+
 
-    review_average = reviews.aggregate(Avg('rating'))['rating__avg'] or 0.0
-    product_rating, created = ProductRating.objects.get_or_create(product=product)
-    product_rating.average_rating = review_average
-    product_rating.total_reviews = total_reviews
-    product_rating.save()
 
+@receiver(post_delete, sender=Category)
+def reindex_orphaned_products(sender, instance, **kwargs):
+    search.index_products(getattr(instance, '_product_ids', []))
@@ -0,0 +1,140 @@
+import re
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+
+# Slug allocation for Product and Category. Existing slugs equal to a base
+# slug or of the form "<base>-<N>" are fetched up front and the next free
+# suffixes are worked out in memory: one query for a single slug, and for
+# a batch one query for the bases plus prefix queries for only those that
+# collide. A base close to max_length is cut short to make room for its
+# suffix, so its suffixed slugs are looked up under each cut-down stem too.
+# The unique constraint stays the final arbiter: a save that loses a race
+# to a concurrent writer allocates again and retries.
+
+FALLBACK = 'item'
+SAVE_ATTEMPTS = 5
+PREFIX_CHUNK = 200
+# Suffixes of up to this many digits are looked up ("-1" ... "-999999").
+SUFFIX_DIGITS = 6
+
+
+def base_slug(value, max_length):
+    return slugify(value)[:max_length].strip('-') or FALLBACK
+
+
+def stem(base, digits, max_length):
+    """What is left of ``base`` in front of a ``digits``-digit suffix."""
+    return base[:max_length - digits - 1].rstrip('-')
+
+
+def with_suffix(base, number, max_length):
+    return f'{stem(base, len(str(number)), max_length)}-{number}'
+
+
+def stems(base, max_length):
+    """{(stem, digits)} that "<base>-<N>" slugs of up to SUFFIX_DIGITS digits start with."""
+    return {(stem(base, digits, max_length), digits) for digits in range(1, SUFFIX_DIGITS + 1)}
+
+
+def taken_slugs(model, bases, field='slug'):
+    """Existing slugs equal to one of ``bases`` or of the form "<base>-<N>"."""
+    bases = set(bases)
+    manager = model._default_manager
+    max_length = model._meta.get_field(field).max_length
+    if len(bases) == 1:
+        base = next(iter(bases))
+        query = Q(Q(**{field: base}), *_prefixes(field, [base], max_length), _connector=Q.OR)
+        return set(manager.filter(query).values_list(field, flat=True))
+
+    taken = set(manager.filter(**{f'{field}__in': bases}).values_list(field, flat=True))
+    prefixes = _prefixes(field, taken, max_length)
+    # Chunked, as SQLite caps the depth of an OR chain at 1000 terms.
+    for start in range(0, len(prefixes), PREFIX_CHUNK):
+        query = Q(*prefixes[start:start + PREFIX_CHUNK], _connector=Q.OR)
+        taken.update(manager.filter(query).values_list(field, flat=True))
+    return taken
+
+
+def _prefixes(field, bases, max_length):
+    prefixes = {f'{cut}-' for base in bases for cut, digits in stems(base, max_length)}
+    return [_prefix(field, prefix) for prefix in sorted(prefixes)]
+
+
+def _prefix(field, prefix):
+    if connection.vendor == 'sqlite':
+        # SQLite's LIKE is case-insensitive and can't use the unique index;
+        # a range over the binary collation can ("x-" <= slug < "x.").
+        return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix[:-1] + chr(ord(prefix[-1]) + 1)})
+    # Postgres serves startswith (LIKE 'x-%') from the varchar_pattern_ops index.
+    return Q(**{f'{field}__startswith': prefix})
+
+
+SUFFIX_RE = re.compile(r'^(.+)-(\d+)$')
+
+
+def highest_suffixes(taken, bases, max_length):
+    """{base: highest N} over taken slugs equal to ``with_suffix(base, N)``."""
+    owners = {}
+    for base in set(bases):
+        for key in stems(base, max_length):
+            owners.setdefault(key, []).append(base)
+
+    highest = {}
+    for slug in taken:
+        match = SUFFIX_RE.match(slug)
+        if match and not match.group(2).startswith('0'):
+            number = int(match.group(2))
+            for base in owners.get((match.group(1), len(match.group(2))), ()):
+                highest[base] = max(highest.get(base, 0), number)
+    return highest
+
+
+def allocate_slugs(model, values, field='slug', reserved=()):
+    """
+    Unique slugs for ``values`` (names), in order, unique against the table,
+    against ``reserved`` and against each other: "cable", "cable-1"...
+    """
+    max_length = model._meta.get_field(field).max_length
+    bases = [base_slug(value, max_length) for value in values]
+    taken = taken_slugs(model, bases, field) | set(reserved)
+    highest = highest_suffixes(taken, bases, max_length)
+
+    slugs = []
+    for base in bases:
+        slug = base
+        if slug in taken:
+            number = highest.get(base, 0)
+            while slug in taken:
+                number += 1
+                slug = with_suffix(base, number, max_length)
+            highest[base] = number
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def allocate_slug(model, value, field='slug'):
+    return allocate_slugs(model, [value], field)[0]
+
+
+def save_with_slug(instance, save, value, field='slug'):
+    """
+    Run ``save`` with a freshly allocated slug. If a concurrent writer takes
+    the same slug first, the unique constraint rejects it and the slug is
+    allocated again, up to SAVE_ATTEMPTS times.
+    """
+    model = type(instance)
+    for attempt in range(SAVE_ATTEMPTS):
+        slug = allocate_slug(model, value, field)
+        setattr(instance, field, slug)
+        try:
+            with transaction.atomic():
+                return save()
+        except IntegrityError:
+            setattr(instance, field, '')
+            lost_race = model._default_manager.filter(**{field: slug}).exists()
+            if not lost_race or attempt == SAVE_ATTEMPTS - 1:
+                raise
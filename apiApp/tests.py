@@ -1,3 +1,1200 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.conf import settings
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+
+from . import cache as catalog_cache
+from . import media_tasks
+from . import retention
+from . import webhooks
+from .benchmark import check_budgets, load_budgets, run_benchmarks, seed_catalog
+from .metrics import registry
+from .models import Cart, CartItem, CatalogVersion, Category, CustomUser, MediaTask, Order, OrderItem, Product, Reviews, WebhookEvent, Wishlist
+from .querydetector import NPlusOneError, assert_no_n_plus_one, normalize
+from .serializers import OrderSerializer
+from .slugs import allocate_slug, allocate_slugs
+
+
+class AddToCartTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.product = Product.objects.create(name="Game Pad", description="Wireless", price="20.00")
+
+    def add(self, product_id, cart_code="cart1"):
+        return self.client.post('/api/add_to_cart/', {'cart_code': cart_code, 'product_id': product_id},
+                                content_type='application/json')
+
+    def test_repeated_adds_increment_one_line(self):
+        for _ in range(3):
+            response = self.add(self.product.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(CartItem.objects.count(), 1)
+        self.assertEqual(response.json()['cartitems'][0]['quantity'], 3)
+
+    def test_unknown_product_is_rejected_without_writing(self):
+        response = self.add(self.product.id + 100)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(Product.objects.count(), 1)
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.pad, self.mouse, self.cable = [Product.objects.create(name=name, price="2.00")
+                                            for name in ("Game Pad", "Mouse", "Cable")]
+        cart = Cart.objects.create(cart_code="cart1")
+        CartItem.objects.create(cart=cart, product=self.pad, quantity=4)
+        CartItem.objects.create(cart=cart, product=self.mouse, quantity=1)
+
+    def batch(self, operations, cart_code="cart1"):
+        return self.client.post('/api/cart_batch/', {'cart_code': cart_code, 'operations': operations},
+                                content_type='application/json')
+
+    def quantities(self, cart_code="cart1"):
+        return dict(CartItem.objects.filter(cart__cart_code=cart_code).values_list('product_id', 'quantity'))
+
+    def test_operations_fold_per_product(self):
+        response = self.batch([
+            # add -> remove -> add: the line ends up with just the last add.
+            {'op': 'add', 'product_id': self.pad.id, 'quantity': 2},
+            {'op': 'remove', 'product_id': self.pad.id},
+            {'op': 'add', 'product_id': self.pad.id, 'quantity': 3},
+            # set -> add: the add counts on top of the new quantity.
+            {'op': 'set', 'product_id': self.mouse.id, 'quantity': 5},
+            {'op': 'add', 'product_id': self.mouse.id},
+            # add to a new line, twice.
+            {'op': 'add', 'product_id': self.cable.id, 'quantity': 2},
+            {'op': 'add', 'product_id': self.cable.id, 'quantity': 2},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.pad.id: 3, self.mouse.id: 6, self.cable.id: 4})
+        self.assertEqual(Decimal(str(response.json()['cart_total'])), Decimal("26.00"))
+
+        self.batch([{'op': 'set', 'product_id': self.pad.id, 'quantity': 0},
+                    {'op': 'add', 'product_id': self.mouse.id, 'quantity': 4}])
+        self.assertEqual(self.quantities(), {self.mouse.id: 10, self.cable.id: 4})
+
+    def test_unknown_product_rejects_the_batch_without_writing(self):
+        response = self.batch([{'op': 'add', 'product_id': self.cable.id},
+                               {'op': 'add', 'product_id': self.cable.id + 100}], cart_code="new")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(self.cable.id + 100), response.json()['error'])
+        self.assertFalse(Cart.objects.filter(cart_code="new").exists())
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_invalid_operations_return_400(self):
+        invalid = [
+            [{'op': 'add', 'product_id': self.pad.id, 'quantity': 0}],
+            [{'op': 'add', 'product_id': self.pad.id, 'quantity': "many"}],
+            [{'op': 'set', 'product_id': self.pad.id, 'quantity': -1}],
+            [{'op': 'set', 'product_id': self.pad.id}],
+            [{'op': 'double', 'product_id': self.pad.id}],
+            [{'op': 'add', 'product_id': 0}],
+            ["add"],
+            {'op': 'add', 'product_id': self.pad.id},
+        ]
+        for operations in invalid:
+            with self.subTest(operations=operations):
+                self.assertEqual(self.batch(operations).status_code, 400)
+        self.assertEqual(self.quantities(), {self.pad.id: 4, self.mouse.id: 1})
+
+    @override_settings(CART_BATCH_MAX_OPERATIONS=3)
+    def test_operation_count_is_capped(self):
+        operations = [{'op': 'add', 'product_id': self.cable.id}]
+        self.assertEqual(self.batch(operations * 3).status_code, 200)
+        response = self.batch(operations * 4)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("At most 3 operations", response.json()['error'])
+        self.assertEqual(self.quantities()[self.cable.id], 3)
+
+
+class ProductPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        prices = ["10.00", "5.50", "5.50", "99.00"] + ["5.50"] * 6 + ["7.00", "10.00"]
+        cls.products = [Product.objects.create(name=f"Cable {i}", price=price, featured=True)
+                        for i, price in enumerate(prices)]
+        Product.objects.create(name="Hidden", price="1.00", featured=False)
+
+    def walk(self, url, link):
+        """Follow ``link`` from ``url``: (ids in catalog order, SQL run, last URL)."""
+        pages, sql = [], []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.client.get(url).json()
+            sql += [query['sql'] for query in queries.captured_queries]
+            pages.append([product['id'] for product in page['results']])
+            last, url = url, page[link]
+        if link == 'previous':
+            pages.reverse()
+        return [id for ids in pages for id in ids], sql, last
+
+    def test_price_ordering_is_a_keyset_over_ties(self):
+        expected = [p.id for p in sorted(self.products, key=lambda p: (Decimal(p.price), p.id))]
+        ids, sql, last = self.walk('/api/products?ordering=price&page_size=3', 'next')
+        self.assertEqual(ids, expected)
+        self.assertFalse([query for query in sql if 'OFFSET' in query])
+
+        page = self.client.get(last).json()
+        ids, sql, _ = self.walk(page['previous'], 'previous')
+        self.assertEqual(ids, expected[:len(expected) - len(page['results'])])
+        self.assertFalse([query for query in sql if 'OFFSET' in query])
+
+    def test_id_ordering_and_bad_cursor(self):
+        ids, sql, _ = self.walk('/api/products?page_size=5', 'next')
+        self.assertEqual(ids, [p.id for p in self.products])
+        forged = [
+            ('', 'xyz'), ('', '["1", "2"]'), ('', '["abc"]'), ('', '[null]'), ('', '[{"id": 1}]'),
+            ('&ordering=price', '["1.0x", "2"]'), ('&ordering=price', '["1.00", null]'), ('&ordering=price', '"1.00"'),
+        ]
+        for ordering, position in forged:
+            with self.subTest(ordering=ordering, position=position):
+                cursor = base64.b64encode(urlencode({'p': position}).encode()).decode()
+                response = self.client.get(f'/api/products?{urlencode({"cursor": cursor})}{ordering}')
+                self.assertEqual(response.status_code, 404)
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        registry.clear()
+        Product.objects.create(name="Game Pad", description="Wireless", price="20.00", featured=True)
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/products')
+        timing = response.headers['Server-Timing']
+        self.assertIn('total;dur=', timing)
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertIn(f'size;desc="{len(response.content)} bytes"', timing)
+
+    async def test_async_views_are_measured(self):
+        response = await AsyncClient().get('/api/async/products')
+        self.assertRegex(response.headers['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/products')
+        self.client.get('/api/products')
+        body = self.client.get('/api/metrics').content.decode()
+        self.assertIn('apiapp_request_duration_seconds_count{view="product_list"} 2', body)
+        self.assertIn('apiapp_db_queries_bucket{view="product_list",le="+Inf"} 2', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 401)
+        response = self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class ConcurrentAddToCartTests(TransactionTestCase):
+    threads = 8
+    adds_per_thread = 25
+
+    def test_concurrent_adds_lose_no_increments(self):
+        product = Product.objects.create(name="Smart Watch", description="Fitness", price="99.00")
+        cart = Cart.objects.create(cart_code="shared")
+        errors = []
+        start = threading.Barrier(self.threads)
+
+        def worker():
+            client = Client()
+            try:
+                start.wait()
+                for _ in range(self.adds_per_thread):
+                    response = client.post('/api/add_to_cart/', {'cart_code': cart.cart_code, 'product_id': product.id},
+                                           content_type='application/json')
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        item = CartItem.objects.get(cart=cart, product=product)
+        self.assertEqual(item.quantity, self.threads * self.adds_per_thread)
+
+
+
+class QueryPlanTests(TestCase):
+    """
+    The hot read paths must be served by the indexes declared on the models.
+    Each test EXPLAINs the SQL a view actually ran (or the queryset it
+    builds), on SQLite or Postgres. Postgres has sequential scans disabled
+    so the tiny test tables don't make a seq scan look cheaper.
+    """
+
+    def setUp(self):
+        self.client = Client()
+        self.product = Product.objects.create(name="Shoe", description="Running", price="50.00")
+        user = CustomUser.objects.create(username="ada", email="ada@example.com")
+        Reviews.objects.create(product=self.product, user=user, rating=5)
+        Order.objects.create(stripe_checkout_id="cs_1", amount=1, currency="usd",
+                             customer_email="ada@example.com", status="Paid")
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql)
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return '\n'.join(' '.join(map(str, row)) for row in cursor.fetchall())
+
+    def assertViewUsesIndex(self, url, table, index_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        statements = [q['sql'] for q in queries.captured_queries if f'FROM "{table}"' in q['sql']]
+        self.assertTrue(statements, f"{url} ran no query against {table}")
+        self.assertIn(index_name, self.explain(statements[0]))
+
+    def assertQuerysetUsesIndex(self, queryset, index_name):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertIn(index_name, queryset.explain())
+
+    def test_product_list_uses_featured_index(self):
+        self.assertViewUsesIndex('/api/products', 'apiApp_product', 'product_featured_idx')
+
+    def test_product_list_by_price_uses_featured_price_index(self):
+        self.assertViewUsesIndex('/api/products?ordering=price', 'apiApp_product', 'product_featured_price_idx')
+
+    def test_order_list_uses_created_index(self):
+        self.assertViewUsesIndex('/api/orders/', 'apiApp_order', 'order_created_idx')
+
+    def test_customer_orders_use_email_index(self):
+        self.assertViewUsesIndex('/api/user_orders/ada@example.com', 'apiApp_order', 'order_email_created_idx')
+
+    def test_product_reviews_use_product_created_index(self):
+        self.assertViewUsesIndex(f'/api/products/{self.product.slug}/reviews', 'apiApp_reviews',
+                                 'review_product_created_idx')
+
+    def test_wishlist_uses_user_created_index(self):
+        self.assertViewUsesIndex('/api/wishlist/ada@example.com', 'apiApp_wishlist', 'wishlist_user_created_idx')
+
+    def test_cart_expiry_uses_updated_index(self):
+        cutoff = timezone.now() - timedelta(days=30)
+        queryset = Cart.objects.filter(updated_at__lt=cutoff).order_by('updated_at').values_list('id', flat=True)[:500]
+        self.assertQuerysetUsesIndex(queryset, 'cart_updated_idx')
+
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'catalog-cache-tests'}},
+    CATALOG_CACHE_LOCK_TIMEOUT=0.2, CATALOG_CACHE_LOCK_POLL=0.01,
+)
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+
+    def builder(self, value):
+        return mock.Mock(return_value=value)
+
+    def test_read_through_and_namespace_invalidation(self):
+        products, categories = self.builder(["p1"]), self.builder(["c1"])
+        for _ in range(2):
+            self.assertEqual(catalog_cache.get_or_build('product', 'list', products, 1), ["p1"])
+            self.assertEqual(catalog_cache.get_or_build('category', 'list', categories, 1), ["c1"])
+        self.assertEqual((products.call_count, categories.call_count), (1, 1))
+
+        catalog_cache.invalidate('product')
+        products.return_value = ["p2"]
+        self.assertEqual(catalog_cache.get_or_build('product', 'list', products, 1), ["p2"])
+        self.assertEqual(catalog_cache.get_or_build('category', 'list', categories, 1), ["c1"])
+        self.assertEqual((products.call_count, categories.call_count), (2, 1))
+
+    def test_category_list_and_details_do_not_share_keys(self):
+        for name in ("All", "List", "Shoes"):
+            Category.objects.create(name=name)
+        listing = self.client.get('/api/categories').json()
+        self.assertEqual([category['slug'] for category in listing], ["all", "list", "shoes"])
+        for slug in ("all", "list"):
+            with self.subTest(slug=slug):
+                detail = self.client.get(f'/api/categories/{slug}').json()
+                self.assertEqual((detail['name'], detail['products']), (slug.title(), []))
+        self.assertEqual(self.client.get('/api/categories').json(), listing)
+
+    def test_waiter_polls_for_the_lock_holders_value(self):
+        key = catalog_cache.make_key('product', 'list', 1)
+        cache = catalog_cache.get_cache()
+        # Another caller holds the lock and fills the key while we poll.
+        cache.add(key + catalog_cache.LOCK_SUFFIX, 1)
+        polls = []
+
+        def sleep(seconds):
+            polls.append(seconds)
+            if len(polls) == 3:
+                cache.set(key, ["from holder"])
+
+        builder = self.builder(["ours"])
+        with mock.patch('apiApp.cache.time.sleep', sleep):
+            self.assertEqual(catalog_cache.get_or_build('product', 'list', builder, 1), ["from holder"])
+        builder.assert_not_called()
+        self.assertEqual(polls, [settings.CATALOG_CACHE_LOCK_POLL] * 3)
+
+    def test_waiter_builds_when_the_lock_holder_dies(self):
+        key = catalog_cache.make_key('product', 'list', 1)
+        catalog_cache.get_cache().add(key + catalog_cache.LOCK_SUFFIX, 1)
+        builder = self.builder(["ours"])
+        started = time.monotonic()
+        self.assertEqual(catalog_cache.get_or_build('product', 'list', builder, 1), ["ours"])
+        self.assertGreaterEqual(time.monotonic() - started, settings.CATALOG_CACHE_LOCK_TIMEOUT)
+        builder.assert_called_once()
+        self.assertEqual(catalog_cache.get_cache().get(key), ["ours"])
+
+    def test_failed_build_releases_the_lock(self):
+        with self.assertRaises(RuntimeError):
+            catalog_cache.get_or_build('product', 'list', mock.Mock(side_effect=RuntimeError), 1)
+        builder = self.builder(["ours"])
+        with mock.patch('apiApp.cache.time.sleep') as sleep:
+            self.assertEqual(catalog_cache.get_or_build('product', 'list', builder, 1), ["ours"])
+        sleep.assert_not_called()
+
+    async def test_async_waiter_polls_for_the_lock_holders_value(self):
+        key = f"catalog:product:v{await catalog_cache.aget_version('product')}:c1:list"
+        cache = catalog_cache.get_cache()
+        await cache.aadd(key + catalog_cache.LOCK_SUFFIX, 1)
+
+        async def sleep(seconds):
+            await cache.aset(key, ["from holder"])
+
+        builder = mock.AsyncMock(return_value=["ours"])
+        with mock.patch('apiApp.cache.asyncio.sleep', sleep):
+            self.assertEqual(await catalog_cache.aget_or_build('product', 'list', builder, 1), ["from holder"])
+        builder.assert_not_called()
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.gear = Category.objects.create(name="Wireless Gear")
+        self.mouse = Product.objects.create(name="Wireless Mouse", description="Small and quiet", price="20.00")
+        self.lamp = Product.objects.create(name="Desk Lamp", description="With a wireless charging base", price="30.00")
+        self.cable = Product.objects.create(name="Cable", description="Braided", price="5.00", category=self.gear)
+        Product.objects.create(name="Mug", description="Ceramic", price="8.00")
+
+    def search(self, query, **params):
+        response = self.client.get('/api/search', {'query': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, query, **params):
+        return [product['id'] for product in self.search(query, **params)['results']]
+
+    def test_name_matches_rank_above_category_then_description(self):
+        self.assertEqual(self.ids("wireless"), [self.mouse.id, self.cable.id, self.lamp.id])
+
+    def test_terms_are_prefixes_and_all_must_match(self):
+        self.assertEqual(self.ids("wire"), [self.mouse.id, self.cable.id, self.lamp.id])
+        self.assertEqual(self.ids("WIRE mou"), [self.mouse.id])
+        self.assertEqual(self.ids("wireless mug"), [])
+        self.assertEqual(self.ids("charg"), [self.lamp.id])
+        self.assertEqual(self.search("!!!")['count'], 0)
+
+    def test_results_are_paginated(self):
+        first = self.search("wire", page_size=2)
+        self.assertEqual(first['count'], 3)
+        self.assertEqual([p['id'] for p in first['results']], [self.mouse.id, self.cable.id])
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([p['id'] for p in second['results']], [self.lamp.id])
+        self.assertIsNone(second['next'])
+        # The page is fetched from the index by LIMIT/OFFSET: count, ids, products.
+        with self.assertNumQueries(3):
+            self.search("wire", page_size=2, page=2)
+
+    def test_index_follows_product_and_category_changes(self):
+        self.gear.name = "Cables"
+        self.gear.save()
+        self.assertEqual(self.ids("wireless"), [self.mouse.id, self.lamp.id])
+        self.assertEqual(self.ids("cables"), [self.cable.id])
+
+        self.gear.delete()
+        self.assertEqual(self.ids("cables"), [])
+        self.assertEqual(self.ids("braided"), [self.cable.id])
+
+        self.mouse.name = "Trackball"
+        self.mouse.save()
+        self.lamp.delete()
+        self.assertEqual(self.ids("wireless"), [])
+        self.assertEqual(self.ids("track"), [self.mouse.id])
+
+        call_command("rebuild_search_index", stdout=io.StringIO())
+        self.assertEqual(self.ids("track"), [self.mouse.id])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        self.product = Product.objects.create(name="Game Pad", description="Wireless", price="20.00", featured=True)
+
+    @override_settings(CATALOG_STAMP_TIMEOUT=60)
+    def test_revalidation_returns_304_without_queries(self):
+        response = self.client.get('/api/products')
+        etag = response.headers['ETag']
+        self.assertIn('Last-Modified', response.headers)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_catalog_change_invalidates_etag(self):
+        etag = self.client.get(f'/api/products/{self.product.slug}').headers['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = "25.00"
+            self.product.save()
+        response = self.client.get(f'/api/products/{self.product.slug}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.json()['price'], "25.00")
+
+    @override_settings(CATALOG_STAMP_TIMEOUT=0)
+    def test_uncached_stamp_sees_bumps_from_other_workers(self):
+        etag = self.client.get('/api/products').headers['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/products', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Another worker's bump: the row changes, this process's cache doesn't hear of it.
+        CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1)
+        response = self.client.get('/api/products', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_bodies_cached_by_this_worker_follow_writes_made_elsewhere(self):
+        urls = [f'/api/products/{self.product.slug}', f'/api/async/products/{self.product.slug}']
+        for url in urls:
+            self.assertEqual(self.client.get(url).json()['price'], "20.00")
+        # Another worker's write: its invalidation never reaches this
+        # process's cache, only the CatalogVersion row moves.
+        Product.objects.filter(pk=self.product.pk).update(price="25.00")
+        CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).json()['price'], "25.00")
+
+    async def test_async_views_revalidate(self):
+        client = AsyncClient()
+        etag = (await client.get('/api/async/categories')).headers['ETag']
+        response = await client.get('/api/async/categories', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+
+class AsyncViewParityTests(TestCase):
+    def test_unknown_product_is_a_404_from_both_views(self):
+        for url in ('/api/products/no-such-thing', '/api/async/products/no-such-thing'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json(), {"error": "Product not found"})
+                self.assertNotIn('ETag', response.headers)
+
+
+class FastSerializationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Audio")
+        headphones = Product.objects.create(name="Héadphones \u2028 \"Pro\"", description="Wireless",
+                                            price="199.90", category=cls.category)
+        # Set without signals: the image file doesn't exist in tests.
+        Product.objects.filter(pk=headphones.pk).update(image="product_img/headphones.png", image_variants={
+            'source': "product_img/headphones.png",
+            'webp': {'200': "variants/ab/abc-200.webp"}, 'jpeg': {'200': "variants/ab/abc-200.jpg"},
+        })
+        Product.objects.create(name="Wireless Speaker", description="Loud", price="5", category=cls.category)
+        Product.objects.create(name="Wireless Mouse", description="Small", price="25.50", image="")
+        Product.objects.create(name="Hidden Wireless Dock", description="Dock", price="80.00", featured=False)
+
+    def fetch(self, url, fast):
+        catalog_cache.get_cache().clear()
+        with override_settings(FAST_SERIALIZATION=fast):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def test_fast_path_is_byte_compatible(self):
+        urls = [
+            '/api/products',
+            '/api/products?ordering=price&page_size=2',
+            '/api/search?query=wireless',
+            '/api/search?query=wire&page_size=1&page=2',
+            f'/api/categories/{self.category.slug}',
+            '/api/async/products?page_size=3',
+            '/api/async/search?query=wireless',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.fetch(url, fast=True), self.fetch(url, fast=False))
+
+    def test_fast_path_cursor_pages_match(self):
+        url = '/api/products?ordering=price&page_size=1'
+        while url:
+            page = json.loads(self.fetch(url, fast=True))
+            self.assertEqual(json.loads(self.fetch(url, fast=False)), page)
+            url = page['next']
+
+
+class OrderHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.orders = {}
+        stamps = ["2026-03-01 09:00", "2026-03-02 00:00", "2026-03-02 12:00", "2026-03-02 23:59:59",
+                  "2026-03-03 00:00", "2026-03-03 08:00", "2026-03-04 10:00"]
+        for i, stamp in enumerate(stamps):
+            order = Order.objects.create(stripe_checkout_id=f"cs_{i}", amount="9.00", currency="usd", status="Paid",
+                                         customer_email="a@example.com" if i % 2 else "b@example.com")
+            created_at = timezone.make_aware(datetime.fromisoformat(stamp))
+            Order.objects.filter(pk=order.pk).update(created_at=created_at)
+            cls.orders[stamp] = order.pk
+
+    def ids(self, url, **params):
+        pages = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            pages.append([order['id'] for order in response.json()['results']])
+            # The next link carries the filters along with the cursor.
+            url, params = response.json()['next'], {}
+        return [pk for page in pages for pk in page], len(pages)
+
+    def expected(self, *stamps):
+        return [self.orders[stamp] for stamp in sorted(stamps, reverse=True)]
+
+    def test_bare_dates_cover_whole_days(self):
+        ids, _ = self.ids('/api/orders/', created_after="2026-03-02", created_before="2026-03-02")
+        self.assertEqual(ids, self.expected("2026-03-02 00:00", "2026-03-02 12:00", "2026-03-02 23:59:59"))
+
+    def test_datetimes_are_exact_bounds(self):
+        ids, _ = self.ids('/api/orders/', created_after="2026-03-02T12:00:00Z", created_before="2026-03-03T08:00:00")
+        self.assertEqual(ids, self.expected("2026-03-02 12:00", "2026-03-02 23:59:59", "2026-03-03 00:00"))
+
+    def test_filtered_history_pages_with_a_cursor(self):
+        ids, pages = self.ids('/api/orders/', created_after="2026-03-02", page_size=2)
+        self.assertEqual(ids, self.expected(*list(self.orders)[1:]))
+        self.assertEqual(pages, 3)
+
+        ids, pages = self.ids('/api/user_orders/a@example.com', created_before="2026-03-03", page_size=1)
+        self.assertEqual(ids, self.expected("2026-03-02 00:00", "2026-03-02 23:59:59", "2026-03-03 08:00"))
+        self.assertEqual(pages, 3)
+
+    def test_invalid_bounds_return_400(self):
+        for params in ({"created_after": "yesterday"}, {"created_before": "2026-13-01"},
+                       {"created_after": "2026-03-02T25:00"}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/orders/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("must be a date or datetime", response.json()['error'])
+
+
+@override_settings(EXPORT_TOKEN='export-token')
+class StreamingExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        products = [Product.objects.create(name=f"Cable {i}", price="3.00") for i in range(3)]
+        for i in range(5):
+            order = Order.objects.create(stripe_checkout_id=f"cs_export_{i}", amount="9.00", currency="usd",
+                                         customer_email="buyer@example.com", status="Paid")
+            for product in products[:i % 3 + 1]:
+                OrderItem.objects.create(order=order, product=product, quantity=i + 1)
+
+    def export(self, url, **headers):
+        return self.client.get(url, HTTP_AUTHORIZATION='Bearer export-token', **headers)
+
+    def test_requires_staff_or_token(self):
+        self.assertEqual(self.client.get('/api/export/orders').status_code, 403)
+
+    def test_json_array_matches_serializer(self):
+        response = self.export('/api/export/orders')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        exported = json.loads(b''.join(response.streaming_content))
+        orders = Order.objects.order_by('id').prefetch_related('items')
+        self.assertEqual(exported, json.loads(JSONRenderer().render(OrderSerializer(orders, many=True).data)))
+
+    def test_ndjson_lines(self):
+        response = self.export('/api/export/orderitems?format=ndjson')
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), OrderItem.objects.count())
+        self.assertEqual(set(json.loads(lines[0])), {'id', 'order', 'product', 'quantity'})
+
+    def test_empty_export_is_valid_json(self):
+        response = self.export('/api/export/orders?created_after=2999-01-01')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_rows_are_fetched_in_chunks(self):
+        response = self.export('/api/export/orders')
+        # One streaming query for the orders plus one items prefetch per chunk of 2.
+        with self.assertNumQueries(1 + 3):
+            data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([order['stripe_checkout_id'] for order in data], [f"cs_export_{i}" for i in range(5)])
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Audio")
+        Product.objects.create(name="Cable", price="1.00")
+        Product.objects.create(name="Cable 1", price="1.00", slug="cable-1")
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, content):
+        path = Path(self.tmpdir.name) / name
+        path.write_text(content, encoding="utf-8")
+        return str(path)
+
+    def run_command(self, *args):
+        return call_command(*args, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_csv_import_creates_products_with_bulk_slugs(self):
+        path = self.write("feed.csv", (
+            "slug,name,description,price,category,featured\n"
+            ",Cable,USB-C,4.5,audio,true\n"
+            ",Cable,Lightning,5,audio,false\n"
+            "studio-monitor,Studio Monitor,Loud,199.99,,\n"
+        ))
+        # Categories, then per batch (inside a savepoint): existing slugs,
+        # slug allocation, one insert, two search index writes; then the
+        # catalog stamp. None of it depends on the number of rows.
+        with self.assertNumQueries(9):
+            self.run_command("import_catalog", path)
+        products = dict(Product.objects.values_list("slug", "price"))
+        self.assertEqual(products["cable-2"], Decimal("4.50"))
+        self.assertEqual(products["cable-3"], Decimal("5.00"))
+        self.assertEqual(products["studio-monitor"], Decimal("199.99"))
+        self.assertFalse(Product.objects.get(slug="cable-3").featured)
+        self.assertEqual(Product.objects.get(slug="cable-2").category, self.category)
+        self.assertEqual(self.client.get('/api/search?query=monitor').json()['count'], 1)
+
+    def test_rows_with_existing_slug_update_in_place(self):
+        path = self.write("feed.ndjson", "\n".join([
+            json.dumps({"slug": "cable", "name": "Cable v2", "price": "2.00", "category": "audio"}),
+            json.dumps({"name": "Bad price", "price": "cheap"}),
+            json.dumps({"name": "Unknown category", "price": "1", "category": "video"}),
+            "not json",
+        ]))
+        with self.assertRaises(CommandError) as raised:
+            self.run_command("import_catalog", path)
+        self.assertIn("Created 0, updated 1 products", str(raised.exception))
+        self.assertIn("3 rows rejected", str(raised.exception))
+        product = Product.objects.get(slug="cable")
+        self.assertEqual((product.name, product.price, product.category), ("Cable v2", Decimal("2.00"), self.category))
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_export_import_round_trip(self):
+        before = list(Product.objects.order_by("id").values("slug", "name", "price", "category", "featured"))
+        for fmt in ("csv", "ndjson"):
+            path = str(Path(self.tmpdir.name) / f"catalog.{fmt}")
+            self.run_command("export_catalog", "--format", fmt, "--output", path)
+            self.run_command("import_catalog", path)
+            self.assertEqual(list(Product.objects.order_by("id").values("slug", "name", "price", "category", "featured")),
+                             before)
+
+
+class SlugAllocationTests(TestCase):
+    def test_next_free_suffix_from_one_query(self):
+        for slug in ("desk-lamp", "desk-lamp-1", "desk-lamp-7", "desk-lamp-pro", "desk-lampshade"):
+            Product.objects.create(name=slug, price="1.00", slug=slug)
+        with self.assertNumQueries(1):
+            self.assertEqual(allocate_slug(Product, "Desk Lamp"), "desk-lamp-8")
+        self.assertEqual(allocate_slug(Product, "Desk Lamp Pro"), "desk-lamp-pro-1")
+
+    def test_batch_allocation_is_unique_within_the_batch(self):
+        Product.objects.create(name="Mug", price="1.00")
+        self.assertEqual(allocate_slugs(Product, ["Mug", "Mug", "Tea", "Tea", "!!!"]),
+                         ["mug-1", "mug-2", "tea", "tea-1", "item"])
+
+    def test_suffix_fits_max_length(self):
+        name = "x" * 60
+        first = Product.objects.create(name=name, price="1.00")
+        second = Product.objects.create(name=name, price="1.00")
+        self.assertEqual(first.slug, "x" * 50)
+        self.assertEqual(second.slug, "x" * 48 + "-1")
+
+    def test_repeated_long_names_keep_counting_past_the_cut(self):
+        name = "Extra long wireless noise cancelling over ear headphones with case"
+        slugs = [Product.objects.create(name=name, price="1.00").slug for _ in range(12)]
+        self.assertEqual(slugs[:3], ["extra-long-wireless-noise-cancelling-over-ear-head",
+                                     "extra-long-wireless-noise-cancelling-over-ear-he-1",
+                                     "extra-long-wireless-noise-cancelling-over-ear-he-2"])
+        self.assertEqual(slugs[-1], "extra-long-wireless-noise-cancelling-over-ear-h-11")
+        self.assertTrue(all(len(slug) <= 50 for slug in slugs))
+        with self.assertNumQueries(1):
+            self.assertEqual(allocate_slugs(Product, [name, name]), [
+                "extra-long-wireless-noise-cancelling-over-ear-h-12",
+                "extra-long-wireless-noise-cancelling-over-ear-h-13",
+            ])
+
+    def test_category_slugs_ignore_products(self):
+        Product.objects.create(name="Audio", price="1.00")
+        Category.objects.create(name="Audio")
+        self.assertEqual([Category.objects.create(name="Audio").slug for _ in range(3)],
+                         ["audio-1", "audio-2", "audio-3"])
+        self.assertEqual(Category.objects.order_by("id").first().slug, "audio")
+
+    def test_save_retries_when_a_concurrent_writer_takes_the_slug(self):
+        real_allocate = allocate_slug
+        calls = []
+
+        def stale_allocate(model, value, field="slug"):
+            # The first allocation is stale: another writer already took it.
+            calls.append(value)
+            return "speaker" if len(calls) == 1 else real_allocate(model, value, field)
+
+        Product.objects.create(name="Speaker", price="1.00")
+        with mock.patch("apiApp.slugs.allocate_slug", stale_allocate):
+            product = Product.objects.create(name="Speaker", price="1.00")
+        self.assertEqual(product.slug, "speaker-1")
+        self.assertEqual(len(calls), 2)
+
+
+class ProductReviewsTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Headset", price="30.00")
+        self.users = [CustomUser.objects.create(username=f"u{i}", email=f"u{i}@example.com") for i in range(5)]
+        for user, rating in zip(self.users, [5, 5, 4, 2, 5]):
+            Reviews.objects.create(product=self.product, user=user, rating=rating)
+
+    def get(self, **params):
+        return self.client.get(f'/api/products/{self.product.slug}/reviews', params)
+
+    def test_histogram_is_maintained_incrementally(self):
+        review = Reviews.objects.get(user=self.users[3])
+        review.rating = 1
+        review.save()
+        Reviews.objects.get(user=self.users[2]).delete()
+        with self.assertNumQueries(2):
+            rating = self.get().json()['rating']
+        self.assertEqual(rating['histogram'], {'1': 1, '2': 0, '3': 0, '4': 0, '5': 3})
+        self.assertEqual(rating['total_reviews'], 4)
+        self.assertEqual(rating['average_rating'], 4.0)
+
+        call_command("rebuild_ratings", stdout=io.StringIO())
+        self.assertEqual(self.get().json()['rating'], rating)
+
+    def test_reviews_are_paginated_newest_first(self):
+        first = self.get(page_size=3).json()
+        self.assertEqual([r['user']['username'] for r in first['results']], ['u4', 'u3', 'u2'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([r['user']['username'] for r in second['results']], ['u1', 'u0'])
+        self.assertIsNone(second['next'])
+
+    def test_product_without_reviews(self):
+        product = Product.objects.create(name="Cable", price="1.00")
+        response = self.client.get(f'/api/products/{product.slug}/reviews')
+        self.assertEqual(response.json()['rating']['histogram'], {str(star): 0 for star in range(1, 6)})
+        self.assertEqual(response.json()['results'], [])
+        self.assertEqual(self.client.get('/api/products/missing/reviews').status_code, 404)
+
+
+class WishlistTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username="ada", email="ada@example.com")
+        self.products = [Product.objects.create(name=f"Lamp {i}", price="10.00") for i in range(4)]
+
+    def toggle(self, product_id, email="ada@example.com"):
+        return self.client.post('/api/wishlist/toggle/', {'email': email, 'product_id': product_id},
+                                content_type='application/json')
+
+    def test_toggle_adds_then_removes(self):
+        product = self.products[0]
+        # Lookup of user and product, then the delete that finds nothing and
+        # the insert (in a savepoint).
+        with self.assertNumQueries(5):
+            self.assertEqual(self.toggle(product.id).json(), {'product_id': product.id, 'wishlisted': True})
+        with self.assertNumQueries(2):
+            self.assertEqual(self.toggle(product.id).json(), {'product_id': product.id, 'wishlisted': False})
+        self.assertFalse(Wishlist.objects.exists())
+
+    def test_toggle_rejects_unknown_user_or_product(self):
+        self.assertEqual(self.toggle(self.products[0].id, email="nobody@example.com").status_code, 404)
+        self.assertEqual(self.toggle(self.products[-1].id + 100).status_code, 404)
+        self.assertEqual(self.toggle("abc").status_code, 400)
+        self.assertFalse(Wishlist.objects.exists())
+
+    def test_legacy_add_to_wishlist_still_toggles(self):
+        body = {'email': self.user.email, 'product_id': self.products[0].id}
+        response = self.client.post('/api/add_to_wishlist/', body, content_type='application/json')
+        self.assertEqual(response.json()['product']['id'], self.products[0].id)
+        self.assertIsNotNone(response.json()['id'])
+        response = self.client.post('/api/add_to_wishlist/', body, content_type='application/json')
+        self.assertEqual(response.status_code, 204)
+
+    def test_listing_and_bulk_status(self):
+        for product in self.products[:3]:
+            self.toggle(product.id)
+        with self.assertNumQueries(1):
+            page = self.client.get('/api/wishlist/ada@example.com', {'page_size': 2}).json()
+        self.assertEqual([item['product']['id'] for item in page['results']],
+                         [self.products[2].id, self.products[1].id])
+        self.assertEqual(len(self.client.get(page['next']).json()['results']), 1)
+
+        ids = ','.join(str(product.id) for product in self.products)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/wishlist/ada@example.com/status?product_ids={ids}')
+        self.assertEqual(response.json(), {'wishlisted': [product.id for product in self.products[:3]]})
+        self.assertEqual(self.client.get('/api/wishlist/ada@example.com/status?product_ids=x').status_code, 400)
+
+
+def image_upload(name, size, mode='RGB', **save_kwargs):
+    buffer = io.BytesIO()
+    Image.new(mode, size, 'red').save(buffer, 'PNG' if name.endswith('.png') else 'JPEG', **save_kwargs)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storages = {**settings.STORAGES, 'default': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': media.name, 'base_url': '/media/'},
+        }}
+        override = override_settings(STORAGES=storages)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def work(self):
+        while media_tasks.process_batch(10):
+            pass
+
+    def test_upload_builds_resized_variants_without_metadata(self):
+        exif = Image.Exif()
+        exif[0x010F] = "Camera maker"
+        with mock.patch('apiApp.images.render') as render:
+            product = Product.objects.create(name="Lamp", price="10.00", image=image_upload("lamp.jpg", (1000, 500), exif=exif))
+        # The save only queues the work.
+        render.assert_not_called()
+        self.assertEqual(MediaTask.objects.get().status, MediaTask.PENDING)
+        self.work()
+        self.assertEqual(MediaTask.objects.get().status, MediaTask.DONE)
+
+        variants = Product.objects.get(pk=product.pk).image_variants
+        self.assertEqual(variants['source'], product.image.name)
+        self.assertEqual(set(variants['webp']), {'200', '400', '800'})
+        with default_storage.open(variants['jpeg']['400']) as f, Image.open(f) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (400, 200)))
+            self.assertFalse(image.getexif())
+        with default_storage.open(variants['webp']['200']) as f, Image.open(f) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (200, 100)))
+
+        data = self.client.get(f'/api/products/{product.slug}').json()
+        self.assertEqual(data['image_variants']['webp']['800'], default_storage.url(variants['webp']['800']))
+        self.assertNotIn('source', data['image_variants'])
+
+    def test_variants_are_content_addressed_and_not_rebuilt(self):
+        first = Product.objects.create(name="A", price="1.00", image=image_upload("a.png", (300, 300), mode='RGBA'))
+        second = Product.objects.create(name="B", price="1.00", image=image_upload("b.png", (300, 300), mode='RGBA'))
+        self.work()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        # Narrower than 400px: only the 200px variant, shared by both uploads.
+        self.assertEqual(first.image_variants['webp'], {'200': second.image_variants['webp']['200']})
+        self.assertEqual(first.image_variants['jpeg'], second.image_variants['jpeg'])
+
+        first.name = "A2"
+        first.save()
+        self.assertFalse(MediaTask.objects.filter(status=MediaTask.PENDING).exists())
+
+    def test_stale_and_failing_tasks(self):
+        product = Product.objects.create(name="Lamp", price="1.00", image=image_upload("a.jpg", (300, 200)))
+        # A new upload before the worker ran re-queues the same task.
+        product.image = image_upload("b.jpg", (300, 200))
+        product.save()
+        self.assertEqual(MediaTask.objects.get().source, product.image.name)
+
+        with mock.patch('apiApp.images.build_variants', side_effect=RuntimeError("boom")), \
+                self.assertLogs('apiApp.media_tasks', 'WARNING'):
+            for attempt in range(settings.MEDIA_TASK_MAX_ATTEMPTS):
+                self.work()
+        task = MediaTask.objects.get()
+        self.assertEqual((task.status, task.attempts), (MediaTask.FAILED, settings.MEDIA_TASK_MAX_ATTEMPTS))
+        self.assertIn("boom", task.last_error)
+
+        # Clearing the image clears the variants without a task.
+        product.image = None
+        product.save()
+        self.assertEqual(Product.objects.get(pk=product.pk).image_variants, {})
+
+    def test_variants_of_a_replaced_image_are_not_served(self):
+        product = Product.objects.create(name="Lamp", price="1.00", featured=True, image=image_upload("a.jpg", (300, 200)))
+        self.work()
+        product.refresh_from_db()
+        product.image = image_upload("b.jpg", (300, 200))
+        product.save()
+        # The old variants are still stored until the worker runs, but no path serves them.
+        self.assertNotEqual(Product.objects.get(pk=product.pk).image_variants, {})
+        for fast in (False, True):
+            with self.subTest(fast=fast), override_settings(FAST_SERIALIZATION=fast):
+                catalog_cache.get_cache().clear()
+                self.assertEqual(self.client.get('/api/products').json()['results'][0]['image_variants'], {})
+        self.assertEqual(self.client.get(f'/api/products/{product.slug}').json()['image_variants'], {})
+
+    def test_import_clears_variants_of_replaced_images(self):
+        kept = Product.objects.create(name="Kept", price="1.00", image=image_upload("k.jpg", (300, 200)))
+        cleared = Product.objects.create(name="Cleared", price="1.00", image=image_upload("c.jpg", (300, 200)))
+        self.work()
+        kept.refresh_from_db()
+        feed = Path(tempfile.mkdtemp()) / "feed.ndjson"
+        self.addCleanup(feed.unlink)
+        feed.write_text("\n".join([
+            json.dumps({"slug": kept.slug, "name": "Kept", "price": "2.00", "image": kept.image.name}),
+            json.dumps({"slug": cleared.slug, "name": "Cleared", "price": "2.00"}),
+        ]), encoding="utf-8")
+        call_command("import_catalog", str(feed), stdout=io.StringIO())
+        self.assertEqual(Product.objects.get(pk=kept.pk).image_variants, kept.image_variants)
+        self.assertEqual(Product.objects.get(pk=cleared.pk).image_variants, {})
+
+    def test_unreadable_image_is_recorded_once(self):
+        product = Product.objects.create(name="Bad", price="1.00", image=SimpleUploadedFile("bad.png", b"nope"))
+        with self.assertLogs('apiApp.images', 'WARNING'):
+            self.work()
+        self.assertEqual(Product.objects.get(pk=product.pk).image_variants, {'source': product.image.name})
+        self.assertEqual(self.client.get(f'/api/products/{product.slug}').json()['image_variants'], {})
+
+    def test_rebuild_media_uses_a_process_pool(self):
+        for i in range(3):
+            Product.objects.create(name=f"P{i}", price="1.00", image=image_upload(f"p{i}.jpg", (500 + i, 300)))
+        Category.objects.create(name="Lights", image=image_upload("c.png", (250, 250)))
+        out = io.StringIO()
+        call_command("rebuild_media", "--workers", "2", "--chunk-size", "2", stdout=out)
+        self.assertIn("product: 3/3 (100%), 3 rendered", out.getvalue())
+        self.assertIn("Rendered 4 images", out.getvalue())
+        self.assertEqual([set(v['jpeg']) for v in Product.objects.order_by('id').values_list('image_variants', flat=True)],
+                         [{'200', '400'}] * 3)
+        self.assertEqual(set(Category.objects.get().image_variants['webp']), {'200'})
+
+        # Already built: the queued tasks and a second rebuild have nothing to render.
+        with mock.patch('apiApp.images.render') as render:
+            self.work()
+            call_command("rebuild_media", "--workers", "0", stdout=io.StringIO())
+        render.assert_not_called()
+
+
+class CheckoutFulfillmentTests(TestCase):
+    def setUp(self):
+        self.products = [Product.objects.create(name=f"Cable {i}", price="2.00") for i in range(10)]
+
+    def cart(self, code, lines):
+        cart = Cart.objects.create(cart_code=code)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=i + 1)
+                                      for i, product in enumerate(self.products[:lines])])
+        return cart
+
+    def session(self, checkout_id):
+        return {"id": checkout_id, "amount_total": 400, "currency": "usd", "customer_email": "buyer@example.com"}
+
+    def fulfill(self, checkout_id, cart_code):
+        with CaptureQueriesContext(connection) as queries:
+            order = webhooks.fulfill_checkout(self.session(checkout_id), cart_code)
+        return order, len(queries)
+
+    def test_redelivery_is_idempotent(self):
+        self.cart("cart1", 3)
+        order, _ = self.fulfill("cs_1", "cart1")
+        self.assertEqual(list(order.items.order_by("product_id").values_list("quantity", flat=True)), [1, 2, 3])
+        self.assertFalse(Cart.objects.exists())
+
+        again, _ = self.fulfill("cs_1", "cart1")
+        self.assertEqual(again.pk, order.pk)
+        self.assertEqual((Order.objects.count(), OrderItem.objects.count()), (1, 3))
+
+    def test_queries_do_not_grow_with_cart_lines(self):
+        self.cart("small", 1)
+        self.cart("large", 10)
+        _, small = self.fulfill("cs_small", "small")
+        order, large = self.fulfill("cs_large", "large")
+        self.assertEqual(order.items.count(), 10)
+        self.assertEqual(small, large)
+
+    def test_missing_or_empty_cart_raises_without_an_order(self):
+        Cart.objects.create(cart_code="empty")
+        for cart_code in (None, "purged", "empty"):
+            with self.subTest(cart_code=cart_code), self.assertRaises(webhooks.FulfillmentError):
+                webhooks.fulfill_checkout(self.session("cs_lost"), cart_code)
+        self.assertFalse(Order.objects.exists())
+
+
+class WebhookQueueTests(TestCase):
+    def setUp(self):
+        product = Product.objects.create(name="Cable", price="2.00")
+        CartItem.objects.create(cart=Cart.objects.create(cart_code="paid"), product=product, quantity=2)
+
+    def enqueue(self, event_id, cart_code="paid"):
+        session = {"id": f"cs_{event_id}", "amount_total": 400, "currency": "usd",
+                   "customer_email": "buyer@example.com", "metadata": {"cart_code": cart_code}}
+        return webhooks.enqueue(event_id, "checkout.session.completed", {"data": {"object": session}})
+
+    def test_redelivery_collapses_onto_the_event_id(self):
+        first = self.enqueue("evt_1")
+        self.assertEqual(self.enqueue("evt_1").pk, first.pk)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+        self.assertEqual(webhooks.process_batch(10), 1)
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.DONE)
+        self.assertEqual(Order.objects.get().items.get().quantity, 2)
+        self.assertEqual(webhooks.process_batch(10), 0)
+
+    def test_a_claim_is_exclusive(self):
+        for i in range(3):
+            self.enqueue(f"evt_{i}")
+        real_uuid4 = uuid.uuid4
+        rival = []
+
+        def racing_uuid4():
+            # Another worker claims the same due events between this
+            # worker's read and its conditional update.
+            if not rival:
+                rival.append(None)
+                rival.extend(webhooks.claim_events(10))
+            return real_uuid4()
+
+        with mock.patch("apiApp.webhooks.uuid.uuid4", racing_uuid4):
+            self.assertEqual(webhooks.claim_events(10), [])
+        self.assertEqual(len(rival[1:]), 3)
+        self.assertEqual(WebhookEvent.objects.filter(status=WebhookEvent.PROCESSING).count(), 3)
+
+    def test_failures_back_off_then_dead_letter(self):
+        event = self.enqueue("evt_lost", cart_code="purged")
+        for attempt in range(1, settings.WEBHOOK_MAX_ATTEMPTS + 1):
+            before = timezone.now()
+            with self.assertLogs("apiApp.webhooks", "WARNING"):
+                self.assertEqual(webhooks.process_batch(10), 1)
+            event.refresh_from_db()
+            self.assertEqual(event.attempts, attempt)
+            self.assertIn("FulfillmentError", event.last_error)
+            if attempt < settings.WEBHOOK_MAX_ATTEMPTS:
+                self.assertEqual(event.status, WebhookEvent.PENDING)
+                delay = min(settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempt - 1), settings.WEBHOOK_RETRY_MAX_SECONDS)
+                self.assertAlmostEqual((event.next_attempt_at - before).total_seconds(), delay, delta=5)
+                # Not due yet.
+                self.assertEqual(webhooks.process_batch(10), 0)
+                WebhookEvent.objects.filter(pk=event.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(event.status, WebhookEvent.DEAD)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(webhooks.process_batch(10), 0)
+
+    def test_events_of_a_dead_worker_are_released(self):
+        self.enqueue("evt_1")
+        claimed = webhooks.claim_events(10)
+        self.assertEqual(webhooks.claim_events(10), [])
+
+        # The worker died; its claim expires after the visibility timeout.
+        expired = timezone.now() - timedelta(seconds=settings.WEBHOOK_VISIBILITY_TIMEOUT + 1)
+        WebhookEvent.objects.update(locked_at=expired)
+        reclaimed = webhooks.claim_events(10)
+        self.assertEqual([event.pk for event in reclaimed], [claimed[0].pk])
+        self.assertNotEqual(reclaimed[0].locked_by, claimed[0].locked_by)
+
+
+class CartRetentionTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Game Pad", price="20.00")
+        old = timezone.now() - timedelta(days=settings.CART_RETENTION_DAYS + 1)
+        for i in range(5):
+            cart = Cart.objects.create(cart_code=f"old{i}")
+            CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        Cart.objects.update(updated_at=old)
+        self.fresh = Cart.objects.create(cart_code="fresh")
+
+    def test_purges_idle_carts_in_batches(self):
+        out = io.StringIO()
+        call_command("purge_carts", "--batch-size", "2", "--pause", "0", stdout=out)
+        self.assertIn("Purged 5 carts and 5 cart items in 3 batches", out.getvalue())
+        self.assertEqual(list(Cart.objects.values_list("cart_code", flat=True)), ["fresh"])
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_cart_writes_keep_a_cart_alive(self):
+        self.client.post('/api/add_to_cart/', {'cart_code': 'old0', 'product_id': self.product.id},
+                         content_type='application/json')
+        item = CartItem.objects.get(cart__cart_code="old1")
+        self.client.delete(f'/api/delete_cartitem/{item.id}/')
+        result = retention.purge_carts(pause=0)
+        self.assertEqual((result.carts, result.items), (3, 3))
+        self.assertEqual(set(Cart.objects.values_list("cart_code", flat=True)), {"old0", "old1", "fresh"})
+
+
+class QueryDetectorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Audio")
+        products = [Product.objects.create(name=f"Speaker {i}", price="10.00", category=category) for i in range(6)]
+        users = [CustomUser.objects.create_user(username=f"user{i}", email=f"user{i}@example.com") for i in range(6)]
+        cart = Cart.objects.create(cart_code="detector")
+        order = Order.objects.create(stripe_checkout_id="cs_detector", amount="60.00", currency="usd",
+                                     customer_email="user0@example.com", status="Paid")
+        for product, user in zip(products, users):
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+            Reviews.objects.create(product=product, user=user, rating=4)
+            Wishlist.objects.create(product=product, user=user)
+            OrderItem.objects.create(order=order, product=product)
+        cls.category = category
+        cls.admin = CustomUser.objects.create_superuser(username="admin", email="admin@example.com", password="x")
+
+    def test_normalize_groups_statements_by_shape(self):
+        self.assertEqual(
+            normalize('SELECT "a" FROM "t" WHERE "id" IN (%s, %s) AND "b" = \'x\' LIMIT 21'),
+            normalize('SELECT "a" FROM "t" WHERE "id" IN (%s) AND "b" = \'y\' LIMIT 1'),
+        )
+
+    def test_lazy_foreign_key_loop_is_reported(self):
+        with self.assertRaises(NPlusOneError) as raised:
+            with assert_no_n_plus_one():
+                [str(review) for review in Reviews.objects.all()]
+        self.assertIn('N+1: 6 queries', str(raised.exception))
+        self.assertIn('test_lazy_foreign_key_loop_is_reported', str(raised.exception))
+
+    def test_endpoints_have_no_n_plus_one(self):
+        urls = [
+            '/api/get_cart/detector',
+            f'/api/categories/{self.category.slug}',
+            '/api/orders/',
+            '/api/user_orders/user0@example.com',
+        ]
+        for url in urls:
+            with self.subTest(url=url), assert_no_n_plus_one():
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(STORAGES={**settings.STORAGES, 'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+    def test_admin_changelists_have_no_n_plus_one(self):
+        self.client.force_login(self.admin)
+        for model in ('cartitem', 'reviews', 'productrating', 'wishlist', 'orderitem'):
+            with self.subTest(model=model), assert_no_n_plus_one():
+                self.assertEqual(self.client.get(f'/admin/apiApp/{model}/').status_code, 200)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Runs every route once against a small synthetic catalog and compares
+    its query count with apiApp/query_budgets.json. Query counts must not
+    depend on catalog size, so a small seed catches N+1 regressions; use
+    `manage.py benchmark_api` for latency and memory at full scale.
+    """
+
+    def test_every_endpoint_stays_within_its_query_budget(self):
+        seed_catalog(products=60, categories=3, users=10, carts=5, reviews=40, orders=20)
+        results = run_benchmarks(iterations=1)
+        self.assertEqual(check_budgets(results, load_budgets()), [])
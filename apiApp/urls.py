@@ -1,6 +1,7 @@
 from django.urls import path 
 
 from . import views
+from . import async_views
 
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
@@ -24,17 +25,25 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('products', views.product_list, name='product_list'),
     path('products/<slug:slug>', views.product_detail, name='product_detail'),
+    path('products/<slug:slug>/reviews', views.product_reviews, name='product_reviews'),
     path('categories', views.category_list, name='category_list'),
     path('categories/<slug:slug>', views.category_detail, name='category_detail'),
     path('add_to_cart/', views.add_to_cart, name='add_to_cart'),
+    path('get_cart/<str:cart_code>', views.get_cart, name='get_cart'),
+    path('get_cart_stat/<str:cart_code>', views.get_cart_stat, name='get_cart_stat'),
+    path('cart_batch/', views.cart_batch, name='cart_batch'),
     path('update_cartitem_quantity/', views.update_cartitem_quantity, name='update_cartitem_quantity'),
     path('add_review/', views.add_review, name='add_review'),
     path("update_review/<int:pk>/", views.update_review, name="update_review"),
     path("delete_review/<int:pk>/", views.delete_review, name="delete_review"),
     path("delete_cartitem/<int:pk>/", views.delete_cartitem, name="delete_cartitem"),
     path("add_to_wishlist/", views.add_to_wishlist, name="add_to_wishlist"),
+    path("wishlist/toggle/", views.toggle_wishlist, name="toggle_wishlist"),
+    path("wishlist/<str:email>", views.list_wishlist, name="list_wishlist"),
+    path("wishlist/<str:email>/status", views.wishlist_status, name="wishlist_status"),
     path("search", views.product_search, name="search"),
     path('orders/', views.list_orders, name='orders'),
+    path('export/<str:resource>', views.export, name='export'),
 
     path("user_orders/<str:email>", views.list_orders_by_email, name="list_orders_by_email"),
     path("create_user/", views.create_user, name="create_user"),
@@ -44,6 +53,14 @@ urlpatterns = [
     path("create_checkout_session/", views.create_checkout_session, name="create_checkout_session"),
     path("webhook/", views.my_webhook_view, name="webhook"),
 
+    path('async/products', async_views.product_list, name='async_product_list'),
+    path('async/products/<slug:slug>', async_views.product_detail, name='async_product_detail'),
+    path('async/categories', async_views.category_list, name='async_category_list'),
+    path('async/search', async_views.product_search, name='async_search'),
+    path('async/create_checkout_session/', async_views.create_checkout_session, name='async_create_checkout_session'),
+
+    path('metrics', views.metrics, name='metrics'),
+
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 
@@ -1,15 +1,29 @@
+import json
+from datetime import datetime, time, timedelta
+
 from django.shortcuts import render
 from django.conf import settings
 import stripe
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import status
-from .models import Cart, CartItem, CustomUser, Order, OrderItem, Product, Category, Reviews, Wishlist
-from .serializers import CartItemSerializer, CartSerializer, CategoryDetailSerializer, CategoryListSerializer, OrderSerializer, ProductListSerializer, ProductDetailSerializer, ReviewSerializer, UserSerializer, WishlistSerializer
-
-from django.http import HttpResponse
+from .models import Cart, CartItem, CustomUser, Order, Product, ProductRating, Category, Reviews, Wishlist
+from .serializers import CartItemSerializer, CartSerializer, CartStatSerializer, CategoryDetailSerializer, CategoryListSerializer, OrderSerializer, ProductListSerializer, ProductDetailSerializer, ProductRatingSerializer, ReviewSerializer, UserSerializer, WishlistItemSerializer, WishlistSerializer
+from .pagination import OrderCursorPagination, ProductCursorPagination, ReviewCursorPagination, SearchPagination, WishlistCursorPagination
+from .search import SearchResults
+from . import cache as catalog_cache
+from .conditional import catalog_condition
+from . import fastpath
+from .fastpath import product_rows
+from . import exports, webhooks, wishlists
+from .carts import CartOperationError, add_item, apply_operations, open_cart, touch_cart
+from .metrics import render_prometheus
+
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 
 
@@ -20,33 +34,59 @@ endpoint_secret = settings.WEBHOOK_SECRET
 
 User = get_user_model()
 
+@catalog_condition
 @api_view(['GET'])
 def product_list(request):
     products = Product.objects.filter(featured=True)
-    serializer =  ProductListSerializer(products, many=True)
-    return Response(serializer.data)
+    paginator = ProductCursorPagination()
+    if settings.FAST_SERIALIZATION:
+        page = paginator.paginate_queryset(product_rows.values(products), request)
+        return paginator.get_paginated_response(product_rows.many(page))
+    products = products.only(*ProductListSerializer.Meta.fields)
+    page = paginator.paginate_queryset(products, request)
+    serializer =  ProductListSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
 
 
 
+@catalog_condition
 @api_view(['GET'])
 def product_detail(request, slug):
-    product = Product.objects.get(slug=slug)
-    serializer = ProductDetailSerializer(product)
-    return Response(serializer.data)
+    def build():
+        product = Product.objects.get(slug=slug)
+        return ProductDetailSerializer(product).data
+
+    try:
+        data = catalog_cache.get_or_build('product', slug, build, request.catalog_version)
+    except Product.DoesNotExist:
+        return Response({"error": "Product not found"}, status=404)
+    return Response(data)
 
 
+@catalog_condition
 @api_view(['GET'])
 def category_list(request):
-    categories = Category.objects.all()
-    serializer = CategoryListSerializer(categories, many=True)
-    return Response(serializer.data)
+    def build():
+        categories = Category.objects.all()
+        return CategoryListSerializer(categories, many=True).data
+
+    # Detail entries share the namespace under 'slug:<slug>', so no slug
+    # (not even "all" or "list") can collide with the list.
+    return Response(catalog_cache.get_or_build('category', 'list', build, request.catalog_version))
 
 
+@catalog_condition
 @api_view(['GET'])
 def category_detail(request, slug):
-    category = Category.objects.get(slug=slug)
-    serializer = CategoryDetailSerializer(category)
-    return Response(serializer.data)
+    def build():
+        if settings.FAST_SERIALIZATION:
+            return fastpath.category_detail(Category.objects.get(slug=slug))
+        category = Category.objects.prefetch_related(
+            Prefetch('products', queryset=Product.objects.order_by('id'))
+        ).get(slug=slug)
+        return CategoryDetailSerializer(category).data
+
+    return Response(catalog_cache.get_or_build('category', f'slug:{slug}', build, request.catalog_version))
 
 
 
@@ -55,14 +95,57 @@ def add_to_cart(request):
     cart_code = request.data.get('cart_code')
     product_id = request.data.get('product_id')
 
-    cart, _ = Cart.objects.get_or_create(cart_code=cart_code)
-    product, _ =  Product.objects.get_or_create(id=product_id)
-    cartitem, created = CartItem.objects.get_or_create(cart=cart, product=product)
+    try:
+        product_id = int(product_id)
+    except (TypeError, ValueError):
+        return Response({"error": "A valid product_id is required"}, status=400)
+    if not Product.objects.filter(id=product_id).exists():
+        return Response({"error": "Product not found"}, status=404)
 
-    if not created:
-        cartitem.quantity += 1
+    cart_id = open_cart(cart_code)
+    add_item(cart_id, product_id)
 
-    cartitem.save()
+    cart = Cart.objects.with_items().get(pk=cart_id)
+    serializer = CartSerializer(cart)
+    return Response(serializer.data)
+
+
+@api_view(['GET'])
+def get_cart(request, cart_code):
+    try:
+        cart = Cart.objects.with_items().get(cart_code=cart_code)
+    except Cart.DoesNotExist:
+        return Response({"error": "Cart not found"}, status=404)
+
+    serializer = CartSerializer(cart)
+    return Response(serializer.data)
+
+
+@api_view(['GET'])
+def get_cart_stat(request, cart_code):
+    try:
+        cart = Cart.objects.with_items().get(cart_code=cart_code)
+    except Cart.DoesNotExist:
+        return Response({"error": "Cart not found"}, status=404)
+
+    serializer = CartStatSerializer(cart)
+    return Response(serializer.data)
+
+
+@api_view(['POST'])
+def cart_batch(request):
+    cart_code = request.data.get('cart_code')
+    operations = request.data.get('operations')
+
+    if not cart_code or not isinstance(operations, list):
+        return Response({"error": "cart_code and a list of operations are required"}, status=400)
+    if len(operations) > settings.CART_BATCH_MAX_OPERATIONS:
+        return Response({"error": f"At most {settings.CART_BATCH_MAX_OPERATIONS} operations per request"}, status=400)
+
+    try:
+        cart = apply_operations(cart_code, operations)
+    except CartOperationError as e:
+        return Response({"error": str(e)}, status=400)
 
     serializer = CartSerializer(cart)
     return Response(serializer.data)
@@ -73,9 +156,10 @@ def update_cartitem_quantity(request):
     cartitem_id = request.data.get('cartitem_id')
     quantity = int(request.data.get('quantity'))
 
-    cartitem = CartItem.objects.get(id=cartitem_id)
+    cartitem = CartItem.objects.select_related('product').get(id=cartitem_id)
     cartitem.quantity = quantity
     cartitem.save()
+    touch_cart(cartitem.cart_id)
 
     serializer = CartItemSerializer(cartitem)
     return Response({"data": serializer.data, "message": "Cart item updated successfully."})
@@ -107,10 +191,26 @@ def add_review(request):
     return Response({"data": serializer.data, "message": "Review added successfully."})
 
 
+@api_view(['GET'])
+def product_reviews(request, slug):
+    try:
+        product = Product.objects.select_related('rating').get(slug=slug)
+    except Product.DoesNotExist:
+        return Response({"error": "Product not found"}, status=404)
+    # The histogram is read from ProductRating, not counted over the reviews.
+    rating = getattr(product, 'rating', None) or ProductRating(product=product)
+
+    paginator = ReviewCursorPagination()
+    page = paginator.paginate_queryset(Reviews.objects.filter(product=product).select_related('user'), request)
+    serializer = ReviewSerializer(page, many=True)
+    data = paginator.get_paginated_response(serializer.data).data
+    return Response({"rating": ProductRatingSerializer(rating).data, **data})
+
+
 @api_view(['PUT'])
 def update_review(request, pk):
     review = Reviews.objects.get(id=pk) 
-    rating = request.data.get("rating")
+    rating = int(request.data.get("rating"))
     comment_text = request.data.get("comment")
 
     review.rating = rating 
@@ -133,6 +233,7 @@ def delete_review(request, pk):
 def delete_cartitem(request, pk):
     cartitem = CartItem.objects.get(id=pk) 
     cartitem.delete()
+    touch_cart(cartitem.cart_id)
 
     return Response("Cartitem deleted successfully!", status=204)
 
@@ -142,19 +243,59 @@ def add_to_wishlist(request):
     email = request.data.get("email")
     product_id = request.data.get("product_id")
 
-    user = User.objects.get(email=email)
-    product = Product.objects.get(id=product_id) 
+    try:
+        user = User.objects.get(email=email)
+        product = Product.objects.get(id=product_id)
+    except (User.DoesNotExist, Product.DoesNotExist, ValueError):
+        return Response({"error": "User or product not found"}, status=404)
 
-    wishlist = Wishlist.objects.filter(user=user, product=product)
-    if wishlist:
-        wishlist.delete()
+    wishlist = wishlists.toggle(user.id, product.id)
+    if wishlist is None:
         return Response("Wishlist deleted successfully!", status=204)
 
-    new_wishlist = Wishlist.objects.create(user=user, product=product)
-    serializer = WishlistSerializer(new_wishlist)
+    wishlist.user, wishlist.product = user, product
+    serializer = WishlistSerializer(wishlist)
     return Response(serializer.data)
 
 
+@api_view(['POST'])
+def toggle_wishlist(request):
+    email = request.data.get("email")
+    try:
+        product_id = int(request.data.get("product_id"))
+    except (TypeError, ValueError):
+        return Response({"error": "A valid product_id is required"}, status=400)
+
+    user_id, product_exists = wishlists.resolve(email, product_id)
+    if user_id is None:
+        return Response({"error": "User not found"}, status=404)
+    if not product_exists:
+        return Response({"error": "Product not found"}, status=404)
+
+    wishlisted = wishlists.toggle(user_id, product_id) is not None
+    return Response({"product_id": product_id, "wishlisted": wishlisted})
+
+
+@api_view(['GET'])
+def list_wishlist(request, email):
+    paginator = WishlistCursorPagination()
+    page = paginator.paginate_queryset(Wishlist.objects.filter(user__email=email).select_related('product'), request)
+    serializer = WishlistItemSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(['GET'])
+def wishlist_status(request, email):
+    try:
+        product_ids = {int(value) for value in request.query_params.get('product_ids', '').split(',') if value}
+    except ValueError:
+        return Response({"error": "product_ids must be a comma-separated list of ids"}, status=400)
+    if len(product_ids) > settings.WISHLIST_STATUS_MAX_IDS:
+        return Response({"error": f"At most {settings.WISHLIST_STATUS_MAX_IDS} product ids per request"}, status=400)
+
+    wishlisted = wishlists.wishlisted(email, product_ids) if product_ids else set()
+    return Response({"wishlisted": sorted(wishlisted)})
+
 
 @api_view(['GET'])
 def product_search(request):
@@ -162,10 +303,50 @@ def product_search(request):
 
     if not query:
         return Response(({"error": "Please provide a search query"}), status=400)
-    products = Product.objects.filter(Q(name__icontains=query)| Q(description__icontains=query)| Q(category__name__icontains=query))
-    serializer = ProductListSerializer(products, many=True)
-    return Response(serializer.data)
-
+    paginator = SearchPagination()
+    if settings.FAST_SERIALIZATION:
+        page = paginator.paginate_queryset(SearchResults(query, rows=product_rows), request)
+        return paginator.get_paginated_response(product_rows.many(page))
+    page = paginator.paginate_queryset(SearchResults(query), request)
+    serializer = ProductListSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+
+
+def checkout_session_params(cart_code, email, cartitems):
+    return dict(
+        customer_email= email,
+        payment_method_types=['card'],
+
+
+        line_items=[
+            {
+                'price_data': {
+                    'currency': 'usd',
+                    'product_data': {'name': item.product.name},
+                    'unit_amount': int(item.product.price * 100), 
+                },
+                'quantity': item.quantity,
+            }
+            for item in cartitems
+        ] + [
+            {
+                'price_data': {
+                    'currency': 'usd',
+                    'product_data': {'name': 'VAT Fee'},
+                    'unit_amount': 500,  # $5 in cents
+                },
+                'quantity': 1,
+            }
+        ],
+
+
+       
+        mode='payment',
+        success_url="https://sites.google.com/view/alx-nexus-success-page/home",
+        cancel_url="https://sites.google.com/view/alx-nexus-success-page/failed",
+        metadata = {"cart_code": cart_code}
+    )
 
 
 @api_view(['POST'])
@@ -173,40 +354,9 @@ def create_checkout_session(request):
     cart_code = request.data.get("cart_code")
     email = request.data.get("email")
     cart = Cart.objects.get(cart_code=cart_code)
+    cartitems = cart.cartitems.select_related('product')
     try:
-        checkout_session = stripe.checkout.Session.create(
-            customer_email= email,
-            payment_method_types=['card'],
-
-
-            line_items=[
-                {
-                    'price_data': {
-                        'currency': 'usd',
-                        'product_data': {'name': item.product.name},
-                        'unit_amount': int(item.product.price * 100), 
-                    },
-                    'quantity': item.quantity,
-                }
-                for item in cart.cartitems.all()
-            ] + [
-                {
-                    'price_data': {
-                        'currency': 'usd',
-                        'product_data': {'name': 'VAT Fee'},
-                        'unit_amount': 500,  # $5 in cents
-                    },
-                    'quantity': 1,
-                }
-            ],
-
-
-           
-            mode='payment',
-            success_url="https://sites.google.com/view/alx-nexus-success-page/home",
-            cancel_url="https://sites.google.com/view/alx-nexus-success-page/failed",
-            metadata = {"cart_code": cart_code}
-        )
+        checkout_session = stripe.checkout.Session.create(**checkout_session_params(cart_code, email, cartitems))
         return Response({'data': checkout_session})
     except Exception as e:
         return Response({'error': str(e)}, status=400)
@@ -218,8 +368,6 @@ def my_webhook_view(request):
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
     event = None
 
-    print("Webhook received:", )
-
     if sig_header is None:
         return HttpResponse(status=400)
 
@@ -230,56 +378,81 @@ def my_webhook_view(request):
     except (ValueError, stripe.error.SignatureVerificationError):
         return HttpResponse(status=400)
 
-    if event['type'] in [
-        'checkout.session.completed',
-        'checkout.session.async_payment_succeeded'
-    ]:
-        print("Payment succeeded event received")
-        session = event['data']['object']
-        cart_code = session.get("metadata", {}).get("cart_code")
-        fulfill_checkout(session, cart_code)
+    # Fulfillment happens in the `process_webhooks` worker; here we only
+    # record the event so Stripe gets its 200 straight away.
+    if event['type'] in webhooks.HANDLERS:
+        webhooks.enqueue(event['id'], event['type'], json.loads(payload))
 
     return HttpResponse(status=200)
 
 
+def filter_orders_by_date(queryset, params):
+    # ?created_after= / ?created_before= accept a date or an ISO datetime.
+    for param, lookup in (('created_after', 'created_at__gte'), ('created_before', 'created_at__lt')):
+        value = params.get(param)
+        if not value:
+            continue
+        try:
+            day = parse_date(value)
+            parsed = parse_datetime(value) if day is None else None
+        except ValueError:
+            day = parsed = None
+        if day is not None:
+            # A bare date covers that whole day.
+            if param == 'created_before':
+                day += timedelta(days=1)
+            parsed = datetime.combine(day, time.min)
+        if parsed is None:
+            raise ValueError(f"'{param}' must be a date or datetime")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        queryset = queryset.filter(**{lookup: parsed})
+    return queryset
+
+
+def paginated_orders(request, orders):
+    try:
+        orders = filter_orders_by_date(orders, request.query_params)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
 
-def fulfill_checkout(session, cart_code):
-    print("Fulfilling order for session:")
-    
-    order = Order.objects.create(stripe_checkout_id=session["id"],
-        amount=session["amount_total"],
-        currency=session["currency"],
-        customer_email=session["customer_email"],
-        status="Paid")
-    
-
-    print(session)
-
-
-    cart = Cart.objects.get(cart_code=cart_code)
-    cartitems = cart.cartitems.all()
-
-    for item in cartitems:
-        orderitem = OrderItem.objects.create(order=order, product=item.product, 
-                                             quantity=item.quantity)
-    
-
-    # Clear the cart after order is created
-    cart.delete()
+    paginator = OrderCursorPagination()
+    page = paginator.paginate_queryset(orders.prefetch_related('items'), request)
+    serializer = OrderSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET'])
 def list_orders(request):
-    orders = Order.objects.all().order_by('-created_at')
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    return paginated_orders(request, Order.objects.all())
 
 
 @api_view(['GET'])
 def list_orders_by_email(request, email):
-    orders = Order.objects.filter(customer_email=email).order_by('-created_at')
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    return paginated_orders(request, Order.objects.filter(customer_email=email))
+
+
+def export(request, resource):
+    # Streams a whole table; staff session or EXPORT_TOKEN bearer only.
+    token = settings.EXPORT_TOKEN
+    if not (request.user.is_staff or (token and request.headers.get("Authorization") == f"Bearer {token}")):
+        return JsonResponse({"error": "Not allowed"}, status=403)
+    if resource not in exports.EXPORTS:
+        return JsonResponse({"error": f"Unknown export '{resource}'"}, status=404)
+    fmt = request.GET.get("format", "json")
+    if fmt not in exports.FORMATS:
+        return JsonResponse({"error": "format must be json or ndjson"}, status=400)
+
+    queryset = exports.queryset_for(resource)
+    if resource == "orders":
+        try:
+            queryset = filter_orders_by_date(queryset, request.GET)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+    response = StreamingHttpResponse(exports.stream(resource, fmt, queryset), content_type=exports.FORMATS[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{resource}.{fmt}"'
+    return response
 
 
 @api_view(["POST"])
@@ -313,4 +486,11 @@ def existing_user(request, email):
         User.objects.get(email=email)
         return Response({"exists": True}, status=status.HTTP_200_OK)
     except User.DoesNotExist:
-        return Response({"exists": False}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        return Response({"exists": False}, status=status.HTTP_404_NOT_FOUND)
+
+def metrics(request):
+    # Prometheus text exposition of this process's request histograms.
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=401)
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,133 @@
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Cart, CartItem, Order, OrderItem, WebhookEvent
+
+
+logger = logging.getLogger(__name__)
+
+
+# Stripe events are stored in WebhookEvent by the webhook view and handled
+# here by the `process_webhooks` worker, so the HTTP request only has to
+# verify the signature and insert one row.
+
+
+class FulfillmentError(Exception):
+    """A paid checkout that can't be turned into an order; the event is retried."""
+
+
+def fulfill_checkout(session, cart_code):
+    # Stripe retries webhooks, so the order is keyed on the checkout id and
+    # a repeat delivery returns the existing order without touching the cart.
+    with transaction.atomic():
+        order, created = Order.objects.get_or_create(
+            stripe_checkout_id=session["id"],
+            defaults={
+                "amount": session["amount_total"],
+                "currency": session["currency"],
+                "customer_email": session["customer_email"],
+                "status": "Paid",
+            },
+        )
+        if not created:
+            return order
+
+        cartitems = list(CartItem.objects.filter(cart__cart_code=cart_code).values_list('product_id', 'quantity'))
+        if not cartitems:
+            # Rolls the order back. Raised rather than recording an order
+            # with no items, so the event ends up dead-lettered in the admin.
+            raise FulfillmentError(f"Checkout {session['id']}: cart {cart_code!r} is missing or empty")
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id, quantity=quantity)
+            for product_id, quantity in cartitems
+        ])
+
+        # Clear the cart after order is created
+        Cart.objects.filter(cart_code=cart_code).delete()
+
+    return order
+
+
+def handle_checkout_completed(payload):
+    session = payload['data']['object']
+    cart_code = (session.get("metadata") or {}).get("cart_code")
+    fulfill_checkout(session, cart_code)
+
+
+HANDLERS = {
+    'checkout.session.completed': handle_checkout_completed,
+    'checkout.session.async_payment_succeeded': handle_checkout_completed,
+}
+
+
+def enqueue(event_id, event_type, payload):
+    # Redeliveries of the same event collapse onto the existing row.
+    event, created = WebhookEvent.objects.get_or_create(
+        event_id=event_id,
+        defaults={"event_type": event_type, "payload": payload},
+    )
+    return event
+
+
+def retry_delay(attempts):
+    delay = settings.WEBHOOK_RETRY_BASE_SECONDS * (2 ** (attempts - 1))
+    return timedelta(seconds=min(delay, settings.WEBHOOK_RETRY_MAX_SECONDS))
+
+
+def claim_events(batch_size):
+    now = timezone.now()
+    # Events held by a worker that died are released after the timeout.
+    WebhookEvent.objects.filter(
+        status=WebhookEvent.PROCESSING,
+        locked_at__lt=now - timedelta(seconds=settings.WEBHOOK_VISIBILITY_TIMEOUT),
+    ).update(status=WebhookEvent.PENDING, locked_by="", locked_at=None)
+
+    due = list(WebhookEvent.objects.filter(
+        status=WebhookEvent.PENDING, next_attempt_at__lte=now
+    ).order_by('next_attempt_at').values_list('id', flat=True)[:batch_size])
+
+    # The conditional update is the claim: a concurrent worker that read the
+    # same ids matches nothing once status has moved on.
+    token = uuid.uuid4().hex
+    WebhookEvent.objects.filter(id__in=due, status=WebhookEvent.PENDING).update(
+        status=WebhookEvent.PROCESSING, locked_by=token, locked_at=now
+    )
+    return list(WebhookEvent.objects.filter(locked_by=token, status=WebhookEvent.PROCESSING).order_by('next_attempt_at'))
+
+
+def process_event(event):
+    handler = HANDLERS.get(event.event_type)
+    try:
+        if handler is not None:
+            handler(event.payload)
+    except Exception:
+        event.attempts += 1
+        event.last_error = traceback.format_exc()
+        if event.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            event.status = WebhookEvent.DEAD
+            logger.error("Webhook event %s dead after %s attempts", event.event_id, event.attempts)
+        else:
+            event.status = WebhookEvent.PENDING
+            event.next_attempt_at = timezone.now() + retry_delay(event.attempts)
+            logger.warning("Webhook event %s failed (attempt %s), retrying", event.event_id, event.attempts)
+    else:
+        event.status = WebhookEvent.DONE
+        event.last_error = ""
+
+    event.locked_by = ""
+    event.locked_at = None
+    event.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error', 'locked_by', 'locked_at', 'updated_at'])
+    return event.status
+
+
+def process_batch(batch_size):
+    events = claim_events(batch_size)
+    for event in events:
+        process_event(event)
+    return len(events)
@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Exists
+
+from .models import Product, Wishlist
+
+
+# Wishlist writes and lookups keyed by (user_id, product_id), relying on the
+# unique_together constraint instead of reading before writing.
+
+
+def resolve(email, product_id):
+    """(user id, whether the product exists) in one query; (None, False) for an unknown email."""
+    row = (
+        get_user_model().objects.filter(email=email)
+        .annotate(product_exists=Exists(Product.objects.filter(id=product_id)))
+        .values_list('id', 'product_exists')
+        .first()
+    )
+    return row or (None, False)
+
+
+def toggle(user_id, product_id):
+    """
+    Remove the product from the user's wishlist if it is there, otherwise
+    add it. Returns the new Wishlist row, or None if it was removed.
+    """
+    # Wishlist has no dependents or signals, so this is a single DELETE.
+    deleted, _ = Wishlist.objects.filter(user_id=user_id, product_id=product_id).delete()
+    if deleted:
+        return None
+    try:
+        with transaction.atomic():
+            return Wishlist.objects.create(user_id=user_id, product_id=product_id)
+    except IntegrityError:
+        # A concurrent toggle inserted the row first.
+        return Wishlist.objects.get(user_id=user_id, product_id=product_id)
+
+
+def wishlisted(email, product_ids):
+    """The subset of ``product_ids`` on the wishlist of the user with ``email``, in one query."""
+    return set(
+        Wishlist.objects.filter(user__email=email, product_id__in=product_ids).values_list('product_id', flat=True)
+    )
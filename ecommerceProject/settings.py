@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apiApp.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -58,6 +59,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'apiApp.querydetector.QueryDetectorMiddleware',
 ]
 
 ROOT_URLCONF = 'ecommerceProject.urls'
@@ -106,6 +108,10 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # A file-backed test database (instead of shared-cache memory)
+            # lets concurrent test threads wait on SQLite's busy timeout
+            # rather than failing with "database table is locked".
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 
@@ -114,6 +120,52 @@ else:
 
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; point CACHE_LOCATION at a shared backend (e.g.
+# redis://...) in production so every worker sees the same catalog cache.
+
+if os.getenv("CACHE_LOCATION"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("CACHE_LOCATION"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 15
+CATALOG_CACHE_LOCK_TIMEOUT = 5
+CATALOG_CACHE_LOCK_POLL = 0.05
+# Seconds the conditional GET stamp (apiApp.conditional) is cached. Bumps
+# only reach a shared cache, so with the per-process default it is not
+# cached at all and each catalog request reads the one CatalogVersion row.
+CATALOG_STAMP_TIMEOUT = CATALOG_CACHE_TIMEOUT if os.getenv("CACHE_LOCATION") else 0
+
+
+# Per-request instrumentation (apiApp.middleware.PerformanceMiddleware).
+# Histograms cover the last PERF_METRICS_WINDOW_SECONDS and are served in
+# Prometheus format at api/metrics; set METRICS_TOKEN to require a bearer token.
+PERF_METRICS_ENABLED = os.getenv("PERF_METRICS_ENABLED", "True") in ["True", "true", "1"]
+PERF_METRICS_WINDOW_SECONDS = 60 * 5
+PERF_METRICS_WINDOW_SLICES = 5
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# N+1 / slow query detector (apiApp.querydetector). Logging mode is meant
+# for development and staging; tests use assert_no_n_plus_one instead.
+QUERY_DETECTOR_ENABLED = os.getenv("QUERY_DETECTOR_ENABLED", "False") in ["True", "true", "1"]
+QUERY_DETECTOR_N_PLUS_ONE_THRESHOLD = 5
+QUERY_DETECTOR_SLOW_QUERY_MS = 100
+
+
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -155,6 +207,20 @@ STATIC_ROOT = BASE_DIR/'staticfiles' #For whitenoise configs
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR/'media'
 
+# Resized copies of Product/Category images (apiApp.images), served in the
+# image_variants field of the product serializers.
+IMAGE_VARIANT_WIDTHS = [200, 400, 800]
+IMAGE_VARIANT_FORMATS = ['webp', 'jpeg']
+IMAGE_VARIANT_QUALITY = 80
+
+# Media worker (python manage.py process_media / rebuild_media): pool
+# processes rendering variants, one per core unless MEDIA_WORKERS is set.
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS") or 0) or os.cpu_count() or 1
+MEDIA_TASK_BATCH_SIZE = 32
+MEDIA_POLL_INTERVAL = 2.0
+MEDIA_TASK_MAX_ATTEMPTS = 3
+MEDIA_TASK_VISIBILITY_TIMEOUT = 60 * 10
+
 STORAGES = {   
     "default": {
         "BACKEND": "django.core.files.storage.FileSystemStorage",
@@ -181,6 +247,49 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'apiApp.CustomUser'
 
 
+# Product catalog pagination (keyset). Clients may ask for ?page_size=
+# up to the hard cap below.
+PRODUCT_LIST_PAGE_SIZE = int(os.getenv("PRODUCT_LIST_PAGE_SIZE", 20))
+PRODUCT_LIST_MAX_PAGE_SIZE = 100
+
+ORDER_PAGE_SIZE = 20
+ORDER_MAX_PAGE_SIZE = 100
+
+REVIEW_PAGE_SIZE = 20
+REVIEW_MAX_PAGE_SIZE = 100
+
+WISHLIST_PAGE_SIZE = 20
+WISHLIST_MAX_PAGE_SIZE = 100
+WISHLIST_STATUS_MAX_IDS = 100
+
+# Streaming exports (api/export/<resource>): rows read and serialized per chunk.
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_TOKEN = os.getenv("EXPORT_TOKEN")
+
+CART_BATCH_MAX_OPERATIONS = 200
+
+# Cart retention (python manage.py purge_carts): carts idle for longer than
+# CART_RETENTION_DAYS are deleted in batches, pausing between them.
+CART_RETENTION_DAYS = int(os.getenv("CART_RETENTION_DAYS", "30"))
+CART_PURGE_BATCH_SIZE = 500
+CART_PURGE_PAUSE = 0.05
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# Serve product_list, product_search and category_detail from .values()
+# rows (apiApp.fastpath) instead of ModelSerializer instances. Same JSON.
+FAST_SERIALIZATION = os.getenv("FAST_SERIALIZATION", "False") in ["True", "true", "1"]
+
+
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_PUBLIC_KEY = os.getenv("STRIPE_PUBLIC_KEY")
-WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
\ No newline at end of file
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# Webhook queue worker (python manage.py process_webhooks)
+WEBHOOK_BATCH_SIZE = 50
+WEBHOOK_POLL_INTERVAL = 1.0
+WEBHOOK_MAX_ATTEMPTS = 8
+WEBHOOK_RETRY_BASE_SECONDS = 30
+WEBHOOK_RETRY_MAX_SECONDS = 60 * 60
+WEBHOOK_VISIBILITY_TIMEOUT = 60 * 5
\ No newline at end of file